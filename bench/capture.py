@@ -0,0 +1,42 @@
+import os
+import sys
+import requests
+
+# Saves the landing page of every catalog entry into bench/fixtures/ for bench/run.py to replay.
+# Needs network access; run it by hand now and then: python bench/capture.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import catalog  # noqa: E402
+from catalog import best_link, hostname  # noqa: E402
+from scraper import http_session  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+
+def main():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    session = http_session()
+    saved = 0
+    seen = set()
+    for entry in catalog.iter_entries(os.path.join(ROOT, "data", "bank_offers.json")):
+        url = best_link(entry.get("links", []))
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        try:
+            r = session.get(url, timeout=20)
+        except requests.RequestException as e:
+            print(f"skip {url}: {type(e).__name__}")
+            continue
+        if r.status_code != 200 or "html" not in r.headers.get("Content-Type", ""):
+            print(f"skip {url}: HTTP {r.status_code}")
+            continue
+        name = f"{hostname(r.url) or 'page'}-{catalog.entry_id(entry)[:8]}.html"
+        with open(os.path.join(FIXTURES_DIR, name), "w", encoding="utf-8") as f:
+            f.write(r.text)
+        saved += 1
+    session.close()
+    print(f"Saved {saved} pages to {FIXTURES_DIR}")
+
+if __name__ == "__main__":
+    main()
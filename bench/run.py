@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmarks for the scrape, schedule and post hot paths. Each case runs in its own
+# process so wall time and peak RSS belong to that case alone.
+#   python bench/run.py                  # run everything, compare with bench/baseline.json
+#   python bench/run.py --only schedule  # one stage
+#   python bench/run.py --save-baseline  # record the current numbers as the baseline
+#   python bench/run.py --check          # exit 1 on a regression (for CI)
+# The parse stage replays bench/fixtures/*.html (see bench/capture.py); without captured
+# pages it uses synthetic ones shaped like bank landing pages. The baseline only means
+# something on the machine that recorded it; re-record it when the runner changes.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "scripts")
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+BASELINE_FILE = os.path.join(ROOT, "bench", "baseline.json")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "1.5"))  # >50% slower or bigger is a regression
+MIN_DELTA_S = float(os.getenv("BENCH_MIN_DELTA_S", "0.05"))  # below this, timing noise dominates
+RUNS = max(1, int(os.getenv("BENCH_RUNS", "3")))  # best of N per case
+
+SCHEDULE_SIZES = [100, 1000, 10000, 100000]
+POST_SIZES = [50]
+PRODUCT_TYPES = ["credit_card", "loan", "other", "fintech_app", "investment", "savings_account"]
+TAGS = ["cashback", "lifetime_free", "fuel", "rbl", "sbi", "travel", "premium", "axis", "icici", "hdfc",
+        "lifestyle", "indusind", "hsbc", "lounge", "nbfc", "instant_loan", "personal_loan", "upi", "savings"]
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+def synthetic_page(i, rng):
+    bank = f"Bank{i}"
+    offers = [
+        f"Get {rng.randint(1, 10)}% cashback on {rng.choice(['fuel', 'travel', 'dining', 'groceries'])} spends",
+        f"Lifetime free card with no annual fee for the first {rng.randint(1, 3)} years",
+        f"Earn {rng.randint(2, 10)}X reward points on online shopping",
+        "Complimentary airport lounge access every quarter",
+        f"Welcome bonus of {rng.randint(500, 5000)} points on joining fee payment",
+    ]
+    filler = " ".join(rng.choice(["secure", "banking", "apply", "today", "terms", "conditions", "privacy", "customer"]) for _ in range(30))
+    body = []
+    for k in range(rng.randint(150, 400)):
+        if k % 17 == 0:
+            body.append(f"<li>{rng.choice(offers)}</li>")
+        elif k % 5 == 0:
+            body.append(f'<div class="card"><img src="/img/{k}.png" width="40"><p>{filler[:rng.randint(20, 200)]}</p></div>')
+        else:
+            body.append(f"<p>{filler[:rng.randint(10, 240)]}</p>")
+    return (
+        f"<!doctype html><html><head><title>{bank} Credit Cards</title>"
+        f'<meta property="og:title" content="{bank} Credit Cards">'
+        f'<meta name="description" content="Apply for {bank} credit cards online">'
+        + ('<meta property="og:image" content="/og.jpg">' if i % 3 else "")
+        + "<script>" + "var x=1;" * 2000 + "</script><style>" + ".a{color:red}" * 500 + "</style>"
+        + f'</head><body><header><nav><img src="/logo-{i}.png"><a href="/">Home</a></nav></header>'
+        + "<main><ul>" + "".join(body) + "</ul></main></body></html>"
+    )
+
+def fixture_pages(count=40):
+    pages = []
+    if os.path.isdir(FIXTURES_DIR):
+        for name in sorted(os.listdir(FIXTURES_DIR)):
+            if name.endswith(".html"):
+                with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                    pages.append((name, f.read()))
+    if pages:
+        return pages, "recorded"
+    rng = random.Random(7)
+    return [(f"synthetic-{i}.html", synthetic_page(i, rng)) for i in range(count)], "synthetic"
+
+def synthetic_catalog(n, rng):
+    entries = []
+    for i in range(n):
+        entries.append({
+            "name": f"Merchant {i}",
+            "product_type": PRODUCT_TYPES[i % len(PRODUCT_TYPES)],
+            "links": [{"type": "official", "url": f"https://merchant{i}.example.com/apply"}],
+            "tags": rng.sample(TAGS, 3),
+            "image": f"https://cdn.example.com/{i}.png",
+            "offer_snippet": f"Merchant {i} offer",
+            "offers": [f"Get {i % 10}% cashback"],
+            "status": "active" if i % 20 else "paused",
+        })
+    return entries
+
+def timed(breakdown, key, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    breakdown[key] = breakdown.get(key, 0.0) + time.perf_counter() - t0
+    return out
+
+def stage_parse(param, tmp):
+    import scraper
+    pages, source = fixture_pages()
+    repeat = int(param or 3)
+    breakdown = {}
+    for _ in range(repeat):
+        for name, html in pages:
+            url = f"https://{name.rsplit('.', 1)[0]}.example.com/"
+            doc = timed(breakdown, "parse_page", scraper.parse_page, html)
+            timed(breakdown, "offer_snippet", scraper.extract_offer_snippet, doc)
+            timed(breakdown, "offers", scraper.extract_offers_texts, doc)
+            timed(breakdown, "image", lambda: scraper.prefer_domain_specific_image(url, doc) or scraper.static_image(url, doc))
+            timed(breakdown, "region_hash", scraper.offer_region_hash, doc)
+    return {"pages": len(pages) * repeat, "source": source, "breakdown": breakdown}
+
+def serve_dir(path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+def stage_browser(param, tmp):
+    import asyncio
+    import scraper
+    from playwright.async_api import async_playwright
+    pages, source = fixture_pages()
+    site = os.path.join(tmp, "site")
+    os.makedirs(site)
+    for name, html in pages:
+        with open(os.path.join(site, name), "w", encoding="utf-8") as f:
+            f.write(html)
+    server = serve_dir(site)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    entries = [{"name": name, "links": [{"type": "official", "url": f"{base}/{name}"}]} for name, _ in pages]
+    breakdown = {}
+
+    async def run():
+        async with async_playwright() as p:
+            browser = await timed_async(breakdown, "launch", p.chromium.launch(headless=True, args=["--no-sandbox"]))
+            contexts = [await browser.new_context() for _ in range(scraper.CONTEXTS)]
+            for context in contexts:
+                await context.route("**/*", scraper.block_route)
+
+            async def one(i, entry):
+                await scraper.scrape_one(contexts[i % len(contexts)], entry, refresh=True)
+
+            await timed_async(breakdown, "scrape", scraper.run_pool(entries, range(len(entries)), one))
+            await browser.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+    return {"pages": len(entries), "source": source, "breakdown": breakdown}
+
+async def timed_async(breakdown, key, coro):
+    t0 = time.perf_counter()
+    out = await coro
+    breakdown[key] = breakdown.get(key, 0.0) + time.perf_counter() - t0
+    return out
+
+def write_history(path, entries, records, rng):
+    import catalog
+    now = int(time.time())
+    ids = [catalog.entry_id(e) for e in entries]
+    with open(path, "w", encoding="utf-8") as f:
+        for k in range(records):
+            ts = now - (records - k) * 600
+            f.write(json.dumps({"id": rng.choice(ids), "ts": ts}) + "\n")
+
+def stage_schedule(param, tmp):
+    import build_schedule
+    import history_store
+    n = int(param)
+    rng = random.Random(n)
+    with open(os.path.join(ROOT, "data", "schedule_config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    breakdown = {}
+    entries = synthetic_catalog(n, rng)
+    hist_path = os.path.join(tmp, "schedule_history.jsonl")
+    write_history(hist_path, entries, min(n * 3, 200000), rng)
+    history = timed(breakdown, "history_index", history_store.load_index, hist_path)
+    index = timed(breakdown, "build_index", build_schedule.build_index, entries)
+    for _ in range(5):
+        timed(breakdown, "build_today_queue", build_schedule.build_today_queue, entries, config, history, index)
+    if n <= 10000:
+        start = build_schedule.ist_today()
+        timed(breakdown, "plan_30_days", build_schedule.plan_horizon, entries, config, history, start, 30, "bench", index)
+    return {"entries": n, "history_records": len(history["times"]), "breakdown": breakdown}
+
+def stage_post(param, tmp):
+    import fake_bot_api
+    n = int(param)
+    server = fake_bot_api.serve(0)
+    os.environ["TELEGRAM_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    import post_to_telegram
+    import post_render
+    rng = random.Random(n)
+    entries = synthetic_catalog(n, rng)
+    health = {e["links"][0]["url"]: {"ok": True, "status": 200, "checked_ts": int(time.time())} for e in entries}
+    post_render.save_json(post_render.LINK_HEALTH_FILE, health)
+    breakdown = {}
+    queue = [dict(e, id=str(i)) for i, e in enumerate(entries)]
+    for item in queue:
+        item["render"] = timed(breakdown, "render", post_render.render, item)
+    post_to_telegram.save_json(post_to_telegram.QUEUE_FILE, queue)
+    t0 = time.perf_counter()
+    timed(breakdown, "drain", post_to_telegram.drain)
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+    return {"posts": n, "posts_per_s": round(n / elapsed, 1) if elapsed else None, "breakdown": breakdown}
+
+STAGES = {
+    "parse": (stage_parse, [3]),
+    "browser": (stage_browser, [1]),
+    "schedule": (stage_schedule, SCHEDULE_SIZES),
+    "post": (stage_post, POST_SIZES),
+}
+
+def stage_env(tmp):
+    # Point every data file at the temp dir so a bench run never touches data/
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": "bench", "TELEGRAM_CHANNEL_ID": "bench",
+        "QUEUE_FILE": os.path.join(tmp, "queue.json"),
+        "PLAN_FILE": os.path.join(tmp, "plan.json"),
+        "POST_HISTORY_FILE": os.path.join(tmp, "post_history.jsonl"),
+        "SCHEDULE_HISTORY_FILE": os.path.join(tmp, "schedule_history.jsonl"),
+        "LINK_HEALTH_FILE": os.path.join(tmp, "link_health.json"),
+        "SHORT_URL_FILE": os.path.join(tmp, "short_urls.json"),
+        "IMAGE_CACHE_FILE": os.path.join(tmp, "image_cache.json"),
+        "IMAGE_CACHE_DIR": os.path.join(tmp, "images"),
+        "ENRICH_JOURNAL_FILE": os.path.join(tmp, "journal.jsonl"),
+        "OFFER_CHANGES_FILE": os.path.join(tmp, "offer_changes.jsonl"),
+        "CATALOG_CACHE_DIR": "",
+        "SHORTENER": "none",
+        "CHAT_RATE_PER_MIN": "600000",
+        "DRAIN_MAX": "1000000",
+    })
+    return env
+
+def run_once(stage, param):
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", stage, str(param), tmp],
+            env=stage_env(tmp), cwd=ROOT, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines() or ["failed"]
+        errors = [l for l in lines if "Error" in l]
+        return {"error": (errors or lines)[-1].strip()}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_wall_s"] = round(wall, 3)
+    return result
+
+def run_case(stage, param):
+    # Best of RUNS child processes: min wall time, max peak RSS
+    best = None
+    for _ in range(RUNS):
+        result = run_once(stage, param)
+        if "error" in result:
+            best = result
+            break
+        if best is None or result["wall_s"] < best["wall_s"]:
+            rss = max(result["peak_rss_mb"], (best or {}).get("peak_rss_mb", 0))
+            best = dict(result, peak_rss_mb=rss)
+        else:
+            best["peak_rss_mb"] = max(best["peak_rss_mb"], result["peak_rss_mb"])
+    best["case"] = f"{stage}:{param}"
+    return best
+
+def child(stage, param, tmp):
+    sys.path.insert(0, SCRIPTS)
+    fn, _ = STAGES[stage]
+    sys_stdout = sys.stdout
+    sys.stdout = sys.stderr  # the scripts print progress; keep stdout for the result line
+    t0 = time.perf_counter()
+    result = fn(param, tmp)
+    result["total_s"] = round(time.perf_counter() - t0, 4)
+    # Wall time is the sum of the measured stages; fixture and catalog setup stay out of it
+    result["wall_s"] = round(sum(result.get("breakdown", {}).values()), 4)
+    result["breakdown"] = {k: round(v, 4) for k, v in result.get("breakdown", {}).items()}
+    result["peak_rss_mb"] = peak_rss_mb()
+    sys.stdout = sys_stdout
+    print(json.dumps(result))
+
+def compare(results, baseline):
+    regressions = []
+    print(f"{'case':<22}{'wall s':>10}{'base':>10}{'ratio':>8}{'rss MB':>9}{'base':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<22}  skipped: {r['error']}")
+            continue
+        base = baseline.get(r["case"]) or {}
+        ratio = r["wall_s"] / base["wall_s"] if base.get("wall_s") else None
+        flag = ""
+        if ratio and ratio > TOLERANCE and r["wall_s"] - base["wall_s"] > MIN_DELTA_S:
+            flag = "  SLOWER"
+            regressions.append(r["case"])
+        if base.get("peak_rss_mb") and r["peak_rss_mb"] > base["peak_rss_mb"] * TOLERANCE:
+            flag += "  BIGGER"
+            regressions.append(r["case"])
+        print(f"{r['case']:<22}{r['wall_s']:>10.3f}{base.get('wall_s', float('nan')):>10.3f}"
+              f"{(ratio or float('nan')):>8.2f}{r['peak_rss_mb']:>9.1f}{base.get('peak_rss_mb', float('nan')):>8.1f}{flag}")
+        top = sorted(r["breakdown"].items(), key=lambda kv: -kv[1])[:4]
+        print("    " + ", ".join(f"{k} {v:.3f}s" for k, v in top))
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--only", action="append", choices=sorted(STAGES))
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--check", action="store_true")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--child", nargs=3, metavar=("STAGE", "PARAM", "TMP"))
+    args = ap.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    results = []
+    for stage in args.only or [s for s in STAGES if s != "browser" or os.getenv("BENCH_BROWSER") == "true"]:
+        for param in STAGES[stage][1]:
+            results.append(run_case(stage, param))
+
+    try:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except Exception:
+        baseline = {}
+    regressions = compare(results, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline.update({r["case"]: {k: r[k] for k in ("wall_s", "peak_rss_mb")} for r in results if "error" not in r})
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {BASELINE_FILE}")
+    if regressions:
+        print("Regressions:", ", ".join(sorted(set(regressions))))
+        if args.check:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
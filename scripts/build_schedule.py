@@ -1,62 +1,83 @@
 import os
-import json
+import time
 import random
 import datetime
-import hashlib
+import catalog
+import history_store
+import metrics
+from timeutil import ist_today
+import shortener
+import post_render
+from config import SCHEDULE_FILE, QUEUE_FILE, SCHEDULE_HISTORY_FILE, SHORT_URL_FILE, PLAN_FILE
+from catalog import entry_id, best_link
+from jsonio import load_json, save_json
 
-DATA_FILE = os.getenv("DATA_FILE", "data/bank_offers.enriched.json")
-FALLBACK_DATA_FILE = os.getenv("FALLBACK_DATA_FILE", "data/bank_offers.json")
-SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "data/schedule_config.json")
-QUEUE_FILE = os.getenv("QUEUE_FILE", "data/today_queue.json")
-STATE_FILE = os.getenv("STATE_FILE", "data/schedule_state.json")
+# Resolve links, short URLs, images and captions here so the post step only has to send
+PRERENDER = os.getenv("PRERENDER", os.getenv("PRESHORTEN", "true")).lower() == "true"
+# Horizon planning: PLAN_DAYS > 0 plans that many days from PLAN_START into PLAN_FILE
+PLAN_DAYS = int(os.getenv("PLAN_DAYS", "0") or 0)
+PLAN_START = os.getenv("PLAN_START", "").strip()  # YYYY-MM-DD; blank=today in IST
+SEED = os.getenv("SEED", "").strip()
 
 # Manual override (workflow input), one of: mon..sun; blank=auto by IST
 DAY_OVERRIDE = os.getenv("DAY_OVERRIDE", "").lower().strip()
 
-def load_json(path):
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_json(path, obj):
-    d = os.path.dirname(path)
-    if d:
-        os.makedirs(d, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-
-def weekday_key(dt=None):
-    if DAY_OVERRIDE in {"mon","tue","wed","thu","fri","sat","sun"}:
+WEEKDAYS = ["mon","tue","wed","thu","fri","sat","sun"]
+
+def weekday_key(day=None):
+    if DAY_OVERRIDE in set(WEEKDAYS):
         return DAY_OVERRIDE
-    dt = dt or datetime.datetime.utcnow()
-    dt_ist = dt + datetime.timedelta(hours=5, minutes=30)
-    return ["mon","tue","wed","thu","fri","sat","sun"][dt_ist.weekday()]
+    return WEEKDAYS[(day or ist_today()).weekday()]
 
-def entry_id(entry):
-    s = (entry.get("name", "") or "") + "|" + (entry.get("product_type", "") or "")
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
+def build_index(entries):
+    # Ids are hashed once; rule pools come from set intersections instead of catalog scans
+    index = {"entries": entries, "ids": [], "by_type": {}, "by_tag": {}, "active": set(), "changed": {}}
+    for i, e in enumerate(entries):
+        index["ids"].append(entry_id(e))
+        if e.get("offers_changed_ts"):
+            index["changed"][i] = int(e["offers_changed_ts"])
+        index["by_type"].setdefault(e.get("product_type"), set()).add(i)
+        for t in e.get("tags") or []:
+            index["by_tag"].setdefault(t, set()).add(i)
+        # Near-duplicates of another entry (see dedup.py) never get a slot of their own
+        if e.get("status", "active") == "active" and not e.get("duplicate_of"):
+            index["active"].add(i)
+    return index
 
-def matches_rule(entry, rule):
+def rule_pool(index, rule):
+    pool = index["active"]
     pt = rule.get("product_type")
-    if pt and entry.get("product_type") != pt:
-        return False
+    if pt:
+        pool = pool & index["by_type"].get(pt, set())
     tags_any = rule.get("tags_any") or []
     if tags_any:
-        etags = set(entry.get("tags") or [])
-        if not any(t in etags for t in tags_any):
-            return False
-    if entry.get("status", "active") != "active":
-        return False
-    return True
+        tagged = set()
+        for t in tags_any:
+            tagged |= index["by_tag"].get(t, set())
+        pool = pool & tagged
+    return sorted(pool)
 
-def filter_by_rule(entries, rule):
-    return [e for e in entries if matches_rule(e, rule)]
+def changed_since(index, cutoff_ts):
+    # Entries whose offers the scraper saw change after cutoff_ts (see offer_changes.jsonl)
+    return {i for i, ts in index["changed"].items() if ts >= cutoff_ts}
 
-def not_recently_posted(candidates, recent_ids):
-    return [e for e in candidates if entry_id(e) not in recent_ids]
+def queue_item(index, i):
+    pick = index["entries"][i]
+    return {
+        "id": index["ids"][i],
+        "name": pick.get("name"),
+        "product_type": pick.get("product_type"),
+        "links": pick.get("links"),
+        "tags": pick.get("tags", []),
+        "image": pick.get("image", ""),
+        "offer_snippet": pick.get("offer_snippet", ""),
+        "offers": pick.get("offers", []),
+        "status": pick.get("status", "active")
+    }
 
-def build_today_queue(entries, config, state):
+def build_today_queue(entries, config, history=None, index=None):
+    index = index or build_index(entries)
+    ids = index["ids"]
     wk = weekday_key()
     calendar = config.get("calendar") or {}
     day_rules = calendar.get(wk, [])
@@ -64,84 +85,210 @@ def build_today_queue(entries, config, state):
     mem_days = int(config.get("rotation_memory_days", 7))
 
     # Recent rotation window
-    recent_ids = set()
-    history = (state or {}).get("history", [])
-    for h in history[-mem_days * posts_per_day:]:
-        hid = h.get("id")
-        if hid:
-            recent_ids.add(hid)
+    recent_ids = history_store.posted_within(history, mem_days) if history else set()
+    # Offers that changed lately go to the front of each (shuffled) pool
+    boost_days = float(config.get("change_boost_days", 3))
+    boosted = changed_since(index, time.time() - boost_days * 86400)
 
     chosen = []
     chosen_ids = set()
-    rng = random.Random()
+    rng = random.Random(SEED or None)
 
-    def add_pick(pick):
-        pid = entry_id(pick)
+    def add_pick(i):
+        pid = ids[i]
         if pid in chosen_ids:
             return False
-        chosen.append({
-            "id": pid,
-            "name": pick.get("name"),
-            "product_type": pick.get("product_type"),
-            "links": pick.get("links"),
-            "tags": pick.get("tags", []),
-            "image": pick.get("image", ""),
-            "offer_snippet": pick.get("offer_snippet", ""),
-            "offers": pick.get("offers", []),
-            "status": pick.get("status", "active")
-        })
+        chosen.append(queue_item(index, i))
         chosen_ids.add(pid)
         return True
 
     # 1) Satisfy rules (avoid recent, ensure unique)
     for rule in day_rules:
-        pool = filter_by_rule(entries, rule)
-        pool_nr = not_recently_posted(pool, recent_ids)
+        pool = rule_pool(index, rule)
+        pool_nr = [i for i in pool if ids[i] not in recent_ids]
         pool_use = pool_nr if pool_nr else pool
         if not pool_use:
             continue
         rng.shuffle(pool_use)
-        for pick in pool_use:
-            if add_pick(pick):
+        pool_use.sort(key=lambda i: i not in boosted)
+        for i in pool_use:
+            if add_pick(i):
                 break
         if len(chosen) >= posts_per_day:
             break
 
     # 2) Top up to posts_per_day with active, prefer not recent, avoid duplicates
     if len(chosen) < posts_per_day:
-        active = [e for e in entries if e.get("status", "active") == "active"]
+        active = sorted(index["active"])
         # First: not recent and not already chosen
-        fallback_pool = [e for e in active if entry_id(e) not in chosen_ids and entry_id(e) not in recent_ids]
+        fallback_pool = [i for i in active if ids[i] not in chosen_ids and ids[i] not in recent_ids]
         rng.shuffle(fallback_pool)
-        for e in fallback_pool:
-            if add_pick(e) and len(chosen) >= posts_per_day:
+        fallback_pool.sort(key=lambda i: i not in boosted)
+        for i in fallback_pool:
+            if add_pick(i) and len(chosen) >= posts_per_day:
                 break
         # If still short, allow recent but not chosen
         if len(chosen) < posts_per_day:
-            extra = [e for e in active if entry_id(e) not in chosen_ids]
+            extra = [i for i in active if ids[i] not in chosen_ids]
             rng.shuffle(extra)
-            for e in extra:
-                if add_pick(e) and len(chosen) >= posts_per_day:
+            for i in extra:
+                if add_pick(i) and len(chosen) >= posts_per_day:
                     break
 
     return chosen
 
-def main():
-    data = load_json(DATA_FILE) or load_json(FALLBACK_DATA_FILE) or []
-    config = load_json(SCHEDULE_FILE) or {}
-    state = load_json(STATE_FILE) or {}
+def plan_horizon(entries, config, history, start, days, seed, index=None):
+    # Fills every (day, slot) of the horizon in one solve. Slots with the fewest candidates go
+    # first so broad rules can't use up what narrow ones need; each slot takes the candidate
+    # that stays outside rotation_memory_days, has been used least, and is farthest from its
+    # other uses, with seeded tie-breaks.
+    index = index or build_index(entries)
+    ids = index["ids"]
+    calendar = config.get("calendar") or {}
+    posts_per_day = int(config.get("posts_per_day", 3))
+    mem_days = int(config.get("rotation_memory_days", 7))
+    boost_days = float(config.get("change_boost_days", 3))
+    rng = random.Random(seed)
+    tiebreak = [rng.random() for _ in ids]
+    active = sorted(index["active"])
+    dates = [start + datetime.timedelta(days=k) for k in range(days)]
 
-    queue = build_today_queue(data, config, state)
-    save_json(QUEUE_FILE, queue)
+    slots = []
+    for k, d in enumerate(dates):
+        rules = calendar.get(WEEKDAYS[d.weekday()], [])[:posts_per_day]
+        pools = [rule_pool(index, r) or None for r in rules]
+        pools += [None] * (posts_per_day - len(pools))  # None = top-up from any active entry
+        for pos, pool in enumerate(pools):
+            slots.append((k, pos, pool))
+    slots.sort(key=lambda s: (s[2] is None, len(s[2] or ()), s[0], s[1]))
+
+    used = {}
+    for hid, ts in ((history or {}).get("last") or {}).items():
+        d = datetime.datetime.utcfromtimestamp(ts).date()
+        used[hid] = [(d - start).days]
+    assigned = [[None] * posts_per_day for _ in dates]
+    day_ids = [set() for _ in dates]
+
+    # Day offset (from start) of each recent offer change; it boosts the slots that follow it
+    changed_day = {i: (datetime.datetime.utcfromtimestamp(ts).date() - start).days for i, ts in index["changed"].items()}
+
+    def score(i, k):
+        seen = used.get(ids[i], [])
+        gap = min((abs(k - u) for u in seen), default=None)
+        too_soon = gap is not None and gap < mem_days
+        fresh = i in changed_day and 0 <= k - changed_day[i] < boost_days
+        return (too_soon, not fresh, len(seen), -(gap if gap is not None else days + mem_days), tiebreak[i])
+
+    for k, pos, pool in slots:
+        cands = [i for i in (pool or active) if ids[i] not in day_ids[k]]
+        if not cands:
+            cands = [i for i in active if ids[i] not in day_ids[k]]
+        if not cands:
+            continue
+        best = min(cands, key=lambda i: score(i, k))
+        assigned[k][pos] = best
+        day_ids[k].add(ids[best])
+        used.setdefault(ids[best], []).append(k)
+
+    plan = {}
+    for k, d in enumerate(dates):
+        items = []
+        for i in assigned[k]:
+            if i is not None:
+                item = queue_item(index, i)
+                item["plan_date"] = d.isoformat()
+                items.append(item)
+        plan[d.isoformat()] = items
+    return plan
 
-    hist = state.get("history", [])
-    ts = datetime.datetime.utcnow().isoformat()
+def render_queue(queue):
+    # Shorten every resolved link in one concurrent batch, then render each item from the caches
+    urls = []
+    for item in queue:
+        url = best_link(item.get("links", []))
+        if url:
+            url = post_render.apply_link_policy(item, url)
+        if url:
+            urls.append(url)
+    cache = load_json(SHORT_URL_FILE) or {}
+    shortener.shorten_many(urls, cache)
+    save_json(SHORT_URL_FILE, cache)
     for item in queue:
-        hist.append({"date": ts, "id": item["id"]})
-    state["history"] = hist[-1000:]
-    save_json(STATE_FILE, state)
+        item["render"] = post_render.render(item)
+    return sum(1 for item in queue if not item["render"].get("skip"))
+
+def take_planned_day(today):
+    # Moves today's items out of the horizon plan (and drops past days) when one exists
+    plan = load_json(PLAN_FILE)
+    if not plan or not plan.get("days"):
+        return []
+    days = plan["days"]
+    items = days.pop(today, [])
+    for d in [d for d in days if d < today]:
+        days.pop(d)
+    save_json(PLAN_FILE, plan)
+    if items:
+        ts = datetime.datetime.utcnow().isoformat()
+        history_store.append(SCHEDULE_HISTORY_FILE, [{"date": ts, "id": item["id"]} for item in items])
+    return items
+
+def build_day_queue(data, config, history, prerender=PRERENDER):
+    # Writes today's queue: the plan's items when it covers today (otherwise the daily cron
+    # would replace the plan), else a fresh pick recorded in the schedule history
+    today = ist_today().isoformat()
+    queue = take_planned_day(today) if not DAY_OVERRIDE else []
+    if queue:
+        print(f"Using today's {len(queue)} planned items from {PLAN_FILE}.")
+    else:
+        with metrics.span("build_today_queue"):
+            queue = build_today_queue(data, config, history)
+        # Stamped like planned items so the post step and the daemon can tell a stale queue
+        for item in queue:
+            item["plan_date"] = today
+        ts = datetime.datetime.utcnow().isoformat()
+        history_store.append(SCHEDULE_HISTORY_FILE, [{"date": ts, "id": item["id"]} for item in queue])
+    if prerender and queue:
+        with metrics.span("render_queue"):
+            render_queue(queue)
+    save_json(QUEUE_FILE, queue)
+    return queue
+
+def main_plan(data, config, history):
+    start = datetime.date.fromisoformat(PLAN_START) if PLAN_START else ist_today()
+    seed = SEED or start.isoformat()
+    with metrics.span("plan_horizon"):
+        days = plan_horizon(data, config, history, start, PLAN_DAYS, seed)
+    if PRERENDER:
+        with metrics.span("render_queue"):
+            render_queue([item for items in days.values() for item in items])
+    # History is written when a planned day is taken into the queue, not for future dates
+    save_json(PLAN_FILE, {
+        "start": start.isoformat(),
+        "days_planned": PLAN_DAYS,
+        "seed": seed,
+        "generated": datetime.datetime.utcnow().isoformat(),
+        "days": days,
+    })
+
+    distinct = len({item["id"] for items in days.values() for item in items})
+    print(f"Planned {PLAN_DAYS} days from {start.isoformat()} ({distinct} distinct merchants, seed {seed}).")
+
+def main():
+    with metrics.span("load_catalog"):
+        data = catalog.load_catalog()
+    config = load_json(SCHEDULE_FILE) or {}
+    history_store.migrate_all()
+    with metrics.span("load_history"):
+        history = history_store.load_index(SCHEDULE_HISTORY_FILE)
+    if not history["in_order"]:
+        history_store.compact(SCHEDULE_HISTORY_FILE)
+
+    if PLAN_DAYS > 0:
+        main_plan(data, config, history)
+        return
 
+    queue = build_day_queue(data, config, history)
     print(f"Built queue with {len(queue)} items for {weekday_key()}.")
 
 if __name__ == "__main__":
-    main()
+    metrics.run(main, "build_schedule")
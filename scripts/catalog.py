@@ -0,0 +1,168 @@
+import os
+import json
+import pickle
+import hashlib
+from urllib.parse import urlparse
+from config import DATA_FILE, ENRICHED_FILE, CATALOG_CACHE_DIR
+
+# Fields owned by the enrichment overlay; everything else comes from the base file
+ENRICHED_FIELDS = ("image", "offer_snippet", "offers", "last_checked_ts", "offer_hash", "offers_changed_ts", "duplicate_of")
+SNAPSHOT_VERSION = 1
+
+def entry_id(entry):
+    s = (entry.get("name", "") or "") + "|" + (entry.get("product_type", "") or "")
+    return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+def best_link(links):
+    if not links:
+        return ""
+    for l in links:
+        if l.get("type") == "official" and l.get("url"):
+            return l["url"]
+    for l in links:
+        if l.get("url"):
+            return l["url"]
+    return ""
+
+def hostname(url):
+    try:
+        return urlparse(url).netloc.lower()
+    except Exception:
+        return ""
+
+def iter_entries(path, chunk_size=1 << 16):
+    # Streams the objects of a top-level JSON array without loading the whole file
+    if not os.path.exists(path):
+        return
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if not started and pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError(f"{path}: expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if started and pos < len(buf) and buf[pos] == "]":
+                return
+            if pos < len(buf):
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise
+                else:
+                    yield obj
+                    pos = end
+                    continue
+            if eof:
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+def overlay_by_id(enriched):
+    out = {}
+    for e in enriched:
+        eid = e.get("id") or entry_id(e)
+        out[eid] = {k: e[k] for k in ENRICHED_FIELDS if k in e}
+    return out
+
+def iter_catalog(base_path=DATA_FILE, enriched_path=ENRICHED_FILE):
+    # Base entries streamed one by one with their enrichment applied; the overlay is small
+    overlay = overlay_by_id(iter_entries(enriched_path))
+    for e in iter_entries(base_path):
+        extra = overlay.get(entry_id(e))
+        yield dict(e, **extra) if extra else e
+
+def file_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def file_hash(path):
+    h = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def snapshot_path(base_path, enriched_path):
+    tag = hashlib.sha1(f"{os.path.abspath(base_path)}|{os.path.abspath(enriched_path)}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CATALOG_CACHE_DIR, f"catalog-{tag}.pickle")
+
+def read_snapshot(path, paths):
+    try:
+        with open(path, "rb") as f:
+            snap = pickle.load(f)
+    except Exception:
+        return None
+    if snap.get("version") != SNAPSHOT_VERSION:
+        return None
+    keys = [file_key(p) for p in paths]
+    if keys == snap.get("keys"):
+        return snap["entries"]
+    # mtimes change on every fresh checkout; fall back to content hashes
+    hashes = [file_hash(p) for p in paths]
+    if hashes == snap.get("hashes"):
+        write_snapshot(path, paths, snap["entries"], hashes)
+        return snap["entries"]
+    return None
+
+def write_snapshot(path, paths, entries, hashes=None):
+    snap = {
+        "version": SNAPSHOT_VERSION,
+        "keys": [file_key(p) for p in paths],
+        "hashes": hashes or [file_hash(p) for p in paths],
+        "entries": entries,
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def load_catalog(base_path=DATA_FILE, enriched_path=ENRICHED_FILE, use_snapshot=True):
+    # Merged base + enrichment view, served from a pickle snapshot while both files are unchanged
+    paths = [base_path, enriched_path]
+    snap_path = snapshot_path(base_path, enriched_path)
+    if use_snapshot and CATALOG_CACHE_DIR:
+        entries = read_snapshot(snap_path, paths)
+        if entries is not None:
+            return entries
+    entries = list(iter_catalog(base_path, enriched_path))
+    if use_snapshot and CATALOG_CACHE_DIR:
+        write_snapshot(snap_path, paths, entries)
+    return entries
+
+def enrichment_record(entry):
+    rec = {"id": entry_id(entry), "name": entry.get("name"), "product_type": entry.get("product_type")}
+    for k in ENRICHED_FIELDS:
+        if entry.get(k):
+            rec[k] = entry[k]
+    return rec
+
+def save_enrichment(entries, path=ENRICHED_FILE):
+    # Writes only the overlay (id + enriched fields); base records stay the single copy
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump([enrichment_record(e) for e in entries], f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
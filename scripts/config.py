@@ -0,0 +1,39 @@
+import os
+
+# Single source of env-driven settings shared by all scripts
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID", "")
+
+# Catalog: hand-edited base records plus the enrichment overlay written by scraper.py
+DATA_FILE = os.getenv("DATA_FILE", "data/bank_offers.json")
+ENRICHED_FILE = os.getenv("ENRICHED_FILE", "data/bank_offers.enriched.json")
+CATALOG_CACHE_DIR = os.getenv("CATALOG_CACHE_DIR", ".cache")
+
+QUEUE_FILE = os.getenv("QUEUE_FILE", "data/today_queue.json")
+PLAN_FILE = os.getenv("PLAN_FILE", "data/queue_plan.json")
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "data/schedule_config.json")
+SCHEDULE_HISTORY_FILE = os.getenv("SCHEDULE_HISTORY_FILE", "data/schedule_history.jsonl")
+POST_HISTORY_FILE = os.getenv("POST_HISTORY_FILE", "data/post_history.jsonl")
+# Legacy full-rewrite history files, only read by history_store.migrate
+STATE_FILE = os.getenv("STATE_FILE", "data/schedule_state.json")
+HISTORY_FILE = os.getenv("HISTORY_FILE", "data/post_history.json")
+
+# Per-host extractor, fetch-tier and link-policy plugins (see domain_plugins.py)
+DOMAIN_PLUGINS_FILE = os.getenv("DOMAIN_PLUGINS_FILE", "data/domain_plugins.json")
+LINK_HEALTH_FILE = os.getenv("LINK_HEALTH_FILE", "data/link_health.json")
+SHORT_URL_FILE = os.getenv("SHORT_URL_FILE", "data/short_urls.json")
+FETCH_CACHE_FILE = os.getenv("FETCH_CACHE_FILE", "data/fetch_cache.json")
+FETCH_TIERS_FILE = os.getenv("FETCH_TIERS_FILE", "data/fetch_tiers.json")
+OFFER_CHANGES_FILE = os.getenv("OFFER_CHANGES_FILE", "data/offer_changes.jsonl")
+# Per-entry scraper results of an unfinished run; removed once the enriched file is written
+ENRICH_JOURNAL_FILE = os.getenv("ENRICH_JOURNAL_FILE", "data/enrich_journal.jsonl")
+# Validated image metadata + Telegram file_ids (committed); normalized image bytes stay in the local cache
+IMAGE_CACHE_FILE = os.getenv("IMAGE_CACHE_FILE", "data/image_cache.json")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".cache/images")
+
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "15"))
+# Sent by the scraper and the image prefetcher
+USER_AGENT = os.getenv("USER_AGENT", "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+POSTS_PER_DAY = int(os.getenv("POSTS_PER_DAY", "3"))
+MAX_CAPTION = 1000 # keep photo captions under 1024
@@ -0,0 +1,175 @@
+import os
+import re
+import random
+import hashlib
+from urllib.parse import urlparse, parse_qsl, urlencode
+import catalog
+import domain_plugins
+import metrics
+from catalog import best_link, entry_id
+
+# Near-duplicate detection with word shingles, MinHash signatures and LSH banding.
+# Offer lines: each cluster of near-identical bullets keeps one representative line.
+# Catalog entries: active entries with the same canonical link and near-identical text
+# are marked duplicate_of the first of them in catalog order; the scheduler skips them.
+OFFER_DUP_THRESHOLD = float(os.getenv("OFFER_DUP_THRESHOLD", "0.6"))
+ENTRY_DUP_THRESHOLD = float(os.getenv("ENTRY_DUP_THRESHOLD", "0.7"))
+# Short offers differ by a single word ("... on fuel" / "... on dining"), which Jaccard alone
+# scores as similar. Offer lines only merge when the shorter one is almost entirely inside
+# the longer (menus repeated with extra words around them), and lines with fewer bigrams
+# than MIN_LINE_SHINGLES only drop exact repeats.
+OFFER_DUP_CONTAINMENT = float(os.getenv("OFFER_DUP_CONTAINMENT", "0.9"))
+MIN_LINE_SHINGLES = int(os.getenv("MIN_LINE_SHINGLES", "4"))
+SHINGLE_WORDS = 2
+# 32 bands of 2 rows: pairs at Jaccard 0.5 share a band with >99.9% probability, pairs
+# below ~0.2 rarely do. Every candidate is confirmed with the exact Jaccard.
+BANDS = 32
+ROWS = 2
+MERSENNE = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed so signatures are stable between runs
+PERMS = [(_rng.randrange(1, MERSENNE), _rng.randrange(0, MERSENNE)) for _ in range(BANDS * ROWS)]
+
+def tokens(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+def shingles(text, k=SHINGLE_WORDS):
+    words = tokens(text)
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def hash64(s):
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+def minhash(shingle_set):
+    hashes = [hash64(s) for s in shingle_set]
+    return [min((a * x + b) % MERSENNE for x in hashes) for a, b in PERMS]
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def containment(a, b):
+    # Share of the smaller set found in the larger one
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+def clusters(sets, threshold, keys=None, min_containment=0.0):
+    # Groups of indices whose shingle sets reach threshold Jaccard (transitively). Only pairs
+    # that share an LSH bucket are compared, so the cost grows with the number of near
+    # duplicates rather than with n^2. keys[i] restricts matches to items with the same key;
+    # items with a None key or no shingles stay alone.
+    parent = list(range(len(sets)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets = {}
+    for i, s in enumerate(sets):
+        key = keys[i] if keys is not None else ""
+        if not s or key is None:
+            continue
+        sig = minhash(s)
+        for band in range(BANDS):
+            buckets.setdefault((key, band, tuple(sig[band * ROWS:(band + 1) * ROWS])), []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pair = (members[x], members[y])
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                a, b = sets[pair[0]], sets[pair[1]]
+                if jaccard(a, b) >= threshold and containment(a, b) >= min_containment:
+                    parent[find(pair[1])] = find(pair[0])
+
+    groups = {}
+    for i in range(len(sets)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values())
+
+def dedup_lines(lines, threshold=OFFER_DUP_THRESHOLD):
+    # Each cluster keeps its shortest line, at the position of the cluster's first line:
+    # a nav menu repeated with extra words around it collapses to its plain form
+    sets = [shingles(l) for l in lines]
+    sets = [s if len(s) >= MIN_LINE_SHINGLES else set() for s in sets]
+    keep = []
+    for group in clusters(sets, threshold, min_containment=OFFER_DUP_CONTAINMENT):
+        best = min(group, key=lambda i: (len(lines[i]), i))
+        keep.append((group[0], lines[best]))
+    out = []
+    seen = set()
+    for _, line in sorted(keep):
+        # Lines that never cluster (too short, no word characters) only drop their exact repeats here
+        norm = re.sub(r"\s+", " ", line).strip().lower()
+        if norm not in seen:
+            seen.add(norm)
+            out.append(line)
+    return out
+
+def canonical_link(entry):
+    # Affiliate redirectors are unwrapped to the merchant URL; scheme, www., trailing slash,
+    # fragment and utm_* parameters don't make two links different
+    url = best_link(entry.get("links", []))
+    if not url:
+        return None
+    url = domain_plugins.redirect_target(url) or url
+    try:
+        u = urlparse(url)
+    except Exception:
+        return None
+    host = u.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(u.query) if not k.lower().startswith("utm_")))
+    return f"{host}{u.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+def entry_text(entry):
+    return " ".join([entry.get("name") or "", entry.get("offer_snippet") or ""] + list(entry.get("offers") or []))
+
+def mark_duplicates(entries, threshold=ENTRY_DUP_THRESHOLD):
+    keys = [canonical_link(e) if e.get("status", "active") == "active" else None for e in entries]
+    groups = [g for g in clusters([shingles(entry_text(e)) for e in entries], threshold, keys) if len(g) > 1]
+    for e in entries:
+        e.pop("duplicate_of", None)
+    for group in groups:
+        # Catalog order decides: the entry listed first stays in rotation
+        rep = entry_id(entries[group[0]])
+        for i in group[1:]:
+            entries[i]["duplicate_of"] = rep
+    return groups
+
+def dedup_catalog(entries):
+    stats = {}
+    for e in entries:
+        offers = e.get("offers")
+        if offers:
+            kept = dedup_lines(offers)
+            if len(kept) < len(offers):
+                e["offers"] = kept
+                stats["offer_lines_dropped"] = stats.get("offer_lines_dropped", 0) + len(offers) - len(kept)
+    groups = mark_duplicates(entries)
+    if groups:
+        stats["duplicate_entries"] = sum(len(g) - 1 for g in groups)
+    return stats
+
+def main():
+    data = catalog.load_catalog(use_snapshot=False)
+    with metrics.span("dedup"):
+        stats = dedup_catalog(data)
+    catalog.save_enrichment(data)
+    names = {entry_id(e): e.get("name") for e in data}
+    for e in data:
+        if e.get("duplicate_of"):
+            print(f"Duplicate: {e.get('name')} -> {names.get(e['duplicate_of'])}")
+    print("DEDUP:", stats)
+
+if __name__ == "__main__":
+    metrics.run(main, "dedup")
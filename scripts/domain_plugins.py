@@ -0,0 +1,137 @@
+import re
+import json
+from urllib.parse import urlparse, parse_qs
+from config import DOMAIN_PLUGINS_FILE
+
+# Per-host rules from data/domain_plugins.json. A plugin may carry:
+#   tier            "static" | "js": which fetch the scraper uses for the host
+#   image / snippet / offers   CSS selectors replacing the generic extractors
+#   image_attr      attribute holding the image URL (default "src"; "content" for meta tags)
+#   max_offers      cap on offer lines (default 8)
+#   image_override  fixed image to post when the entry has none
+#   link            {"tags_any", "name_contains", "replace_with", "fallback_if_unhealthy", "drop_if_unhealthy"}
+#   subdomains      true to also match every subdomain of the host
+SELECTOR_KEYS = ("image", "snippet", "offers")
+
+_registry = None
+
+def compile_plugin(host, spec):
+    # Selectors stay strings until the scraper uses them; see selector()
+    return dict(spec, host=host, compiled={})
+
+def selector(plugin, key):
+    # soupsieve ships with beautifulsoup4, which only the enrichment job installs
+    compiled = plugin["compiled"]
+    if key not in compiled:
+        import soupsieve
+        compiled[key] = soupsieve.compile(plugin[key])
+    return compiled[key]
+
+def load_registry(path=DOMAIN_PLUGINS_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            specs = json.load(f).get("hosts") or {}
+    except Exception:
+        specs = {}
+    registry = {"exact": {}, "suffix": {}}
+    for host, spec in specs.items():
+        host = host.lower()
+        plugin = compile_plugin(host, spec)
+        registry["exact"][host] = plugin
+        if spec.get("subdomains"):
+            registry["suffix"][host] = plugin
+    return registry
+
+def registry():
+    global _registry
+    if _registry is None:
+        _registry = load_registry()
+    return _registry
+
+def check_selectors():
+    # Compiles every selector up front (the enrich job calls this before crawling). A selector
+    # that doesn't compile is reported and dropped, so the host falls back to the generic
+    # extractors instead of failing page by page mid-run.
+    problems = []
+    for host, plugin in registry()["exact"].items():
+        for key in SELECTOR_KEYS:
+            if not plugin.get(key):
+                continue
+            try:
+                selector(plugin, key)
+            except Exception as e:
+                problems.append(f"{host}.{key}: {str(e).splitlines()[0]}")
+                plugin.pop(key)
+    for p in problems:
+        print(f"Bad selector in {DOMAIN_PLUGINS_FILE}: {p}")
+    return problems
+
+def lookup_host(host):
+    # Exact host first, then parent domains registered with subdomains: true
+    reg = registry()
+    host = (host or "").lower()
+    plugin = reg["exact"].get(host)
+    if plugin:
+        return plugin
+    labels = host.split(".")
+    for i in range(1, len(labels) - 1):
+        plugin = reg["suffix"].get(".".join(labels[i:]))
+        if plugin:
+            return plugin
+    return None
+
+def redirect_target(url):
+    # Affiliate redirectors carry the merchant URL in a url= parameter
+    try:
+        qs = parse_qs(urlparse(url).query)
+    except Exception:
+        return ""
+    target = (qs.get("url") or [""])[0]
+    return target if target.startswith("http") else ""
+
+def lookup(url, follow_redirect=False):
+    try:
+        plugin = lookup_host(urlparse(url).netloc)
+    except Exception:
+        plugin = None
+    if plugin is None and follow_redirect:
+        target = redirect_target(url)
+        if target:
+            return lookup(target)
+    return plugin
+
+def extracts(plugin):
+    return bool(plugin) and any(plugin.get(k) for k in SELECTOR_KEYS)
+
+def text_of(el):
+    return re.sub(r"\s+", " ", el.get_text(" ", strip=True))
+
+def apply(plugin, soup, doc):
+    # Fills doc["offers"], doc["plugin_image"] and doc["plugin_snippet"] from the plugin's selectors
+    if plugin.get("offers"):
+        seen = set()
+        for el in selector(plugin, "offers").select(soup, limit=int(plugin.get("max_offers", 8)) * 2):
+            txt = text_of(el)
+            if txt and txt not in seen:
+                seen.add(txt)
+                doc["offers"].append(txt)
+        doc["offers"] = doc["offers"][:int(plugin.get("max_offers", 8))]
+    if plugin.get("image"):
+        el = selector(plugin, "image").select_one(soup)
+        if el is not None:
+            doc["plugin_image"] = (el.get(plugin.get("image_attr", "src")) or "").strip()
+    if plugin.get("snippet"):
+        el = selector(plugin, "snippet").select_one(soup)
+        if el is not None:
+            doc["plugin_snippet"] = text_of(el)
+    return doc
+
+def matches(policy, entry):
+    # A link policy without tags_any/name_contains applies to every entry linking to the host
+    tags_any = policy.get("tags_any") or []
+    names = policy.get("name_contains") or []
+    if not tags_any and not names:
+        return True
+    tags = set(entry.get("tags") or [])
+    name_l = (entry.get("name") or "").lower()
+    return any(t in tags for t in tags_any) or any(n in name_l for n in names)
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Minimal stand-in for the Telegram Bot API: accepts /bot<token>/<method>, answers ok,
+# and can inject 429s / 5xx to exercise retries. Run: python scripts/fake_bot_api.py [port]
+FAKE_429_EVERY = int(os.getenv("FAKE_429_EVERY", "0"))
+FAKE_500_EVERY = int(os.getenv("FAKE_500_EVERY", "0"))
+FAKE_RETRY_AFTER = int(os.getenv("FAKE_RETRY_AFTER", "1"))
+FAKE_BAD_PHOTO = os.getenv("FAKE_BAD_PHOTO", "bad-image")  # photo URLs containing this fail with 400
+FAKE_LOG_FILE = os.getenv("FAKE_LOG_FILE", "")
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    calls = []
+    lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def read_payload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        ctype = self.headers.get("Content-Type") or ""
+        if ctype.startswith("application/json"):
+            return json.loads(raw or b"{}")
+        if ctype.startswith("application/x-www-form-urlencoded"):
+            return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+        return {"_raw_bytes": len(raw)}
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        payload = self.read_payload()
+        with self.lock:
+            n = len(self.calls) + 1
+            self.calls.append({"ts": time.time(), "method": method, "payload": payload})
+            if FAKE_LOG_FILE:
+                with open(FAKE_LOG_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self.calls[-1], ensure_ascii=False) + "\n")
+        if FAKE_429_EVERY and n % FAKE_429_EVERY == 0:
+            return self.reply(429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                    "parameters": {"retry_after": FAKE_RETRY_AFTER}})
+        if FAKE_500_EVERY and n % FAKE_500_EVERY == 0:
+            return self.reply(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+        photos = [payload.get("photo", "")] if isinstance(payload, dict) else []
+        if method == "sendMediaGroup":
+            media = payload.get("media", [])
+            if isinstance(media, str):
+                media = json.loads(media)
+            photos = [m.get("media", "") for m in media]
+        if any(FAKE_BAD_PHOTO and FAKE_BAD_PHOTO in (p or "") for p in photos):
+            return self.reply(400, {"ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier/HTTP URL specified"})
+        result = {"message_id": n, "date": int(time.time())}
+        if method in ("sendPhoto", "sendMediaGroup"):
+            result["photo"] = [{"file_id": f"fake-file-{n}", "width": 800, "height": 600}]
+        if method == "sendMediaGroup":
+            result = [dict(result, message_id=n * 100 + i) for i in range(len(photos))]
+        self.reply(200, {"ok": True, "result": result})
+
+def serve(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeBotApi)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeBotApi)
+    print(f"Fake Bot API on http://127.0.0.1:{port} (set TELEGRAM_API_BASE to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import bisect
+import datetime
+from config import SCHEDULE_HISTORY_FILE, POST_HISTORY_FILE, STATE_FILE, HISTORY_FILE
+
+def record_ts(rec):
+    ts = rec.get("ts")
+    if isinstance(ts, (int, float)):
+        return int(ts)
+    date = rec.get("date")
+    if date:
+        try:
+            dt = datetime.datetime.fromisoformat(date)
+        except ValueError:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return int(dt.timestamp())
+    return None
+
+def append(path, records):
+    # One line per record; nothing already on disk is rewritten
+    if isinstance(records, dict):
+        records = [records]
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for rec in records:
+            if "ts" not in rec:
+                rec = dict(rec, ts=record_ts(rec) or int(time.time()))
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+def read(path):
+    if not os.path.exists(path):
+        return []
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line from an interrupted append
+    return out
+
+def load_index(path, key="id"):
+    # Sorted (ts, key) pairs for time-window queries plus the last ts per key
+    times = []
+    last = {}
+    in_order = True
+    prev = None
+    for rec in read(path):
+        ts = record_ts(rec)
+        k = rec.get(key)
+        if ts is None or not k:
+            continue
+        if prev is not None and ts < prev:
+            in_order = False
+        prev = ts
+        times.append((ts, k))
+        if ts > last.get(k, -1):
+            last[k] = ts
+    if not in_order:
+        times.sort()
+    return {"path": path, "times": times, "last": last, "in_order": in_order}
+
+def posted_within(index, days, now=None):
+    now = now if now is not None else time.time()
+    times = index["times"]
+    start = bisect.bisect_left(times, (int(now - days * 86400), ""))
+    # Anything dated after now was never posted; it can't count as recent
+    end = bisect.bisect_right(times, (int(now), "\uffff"))
+    return {k for _, k in times[start:end]}
+
+def compact(path):
+    # Rewrites the log in timestamp order without malformed or duplicate lines
+    seen = set()
+    rows = []
+    for rec in read(path):
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+        if line in seen:
+            continue
+        seen.add(line)
+        rows.append((record_ts(rec) or 0, rec))
+    rows.sort(key=lambda r: r[0])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for _, rec in rows:
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp, path)
+    return len(rows)
+
+def migrate(legacy_path, path, extract):
+    # Imports a legacy JSON history once; a no-op when the log already exists
+    if os.path.exists(path) or not os.path.exists(legacy_path):
+        return 0
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    records = extract(legacy) or []
+    append(path, records)
+    return len(records)
+
+def migrate_all():
+    n_sched = migrate(STATE_FILE, SCHEDULE_HISTORY_FILE, lambda s: (s or {}).get("history", []))
+    n_post = migrate(HISTORY_FILE, POST_HISTORY_FILE, lambda h: h or [])
+    return n_sched, n_post
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if cmd == "migrate":
+        n_sched, n_post = migrate_all()
+        print(f"Imported {n_sched} schedule and {n_post} post history records.")
+    elif cmd == "compact":
+        for path in sys.argv[2:] or [SCHEDULE_HISTORY_FILE, POST_HISTORY_FILE]:
+            print(f"{path}: {compact(path)} records")
+    else:
+        print("usage: history_store.py [migrate | compact [path ...]]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import io
+import os
+import time
+import hashlib
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import catalog
+import metrics
+from jsonio import load_json, save_json
+from config import IMAGE_CACHE_FILE, IMAGE_CACHE_DIR, HTTP_TIMEOUT, USER_AGENT
+
+IMAGE_TTL_DAYS = float(os.getenv("IMAGE_TTL_DAYS", "7"))
+IMAGE_WORKERS = max(1, int(os.getenv("IMAGE_WORKERS", "8")))
+# Favicons (128px) and generated avatars fall under the floor and go out as text posts instead
+IMAGE_MIN_SIDE = int(os.getenv("IMAGE_MIN_SIDE", "200"))
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()  # jpeg | webp
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+FORCE_CHECK = os.getenv("FORCE_CHECK", "false").lower() == "true"
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+# Telegram photo limits: 10 MB, width + height <= 10000, aspect ratio <= 20
+TG_MAX_BYTES = 10 * 1024 * 1024
+TG_MAX_SIDES = 10000
+TG_MAX_RATIO = 20
+
+EXTS = {"jpeg": "jpg", "png": "png", "webp": "webp", "gif": "gif"}
+
+def load_cache(path=IMAGE_CACHE_FILE):
+    # {"urls": {url: validation record}, "files": {sha or url: {"file_id", "ts"}}}
+    cache = load_json(path, default={}) or {}
+    cache.setdefault("urls", {})
+    cache.setdefault("files", {})
+    return cache
+
+def sniff(data):
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"GIF8":
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return ""
+
+def blob_path(sha, ext):
+    return os.path.join(IMAGE_CACHE_DIR, sha[:2], f"{sha}.{ext}")
+
+def download(session, url):
+    r = session.get(url, timeout=HTTP_TIMEOUT, stream=True, headers={"User-Agent": USER_AGENT})
+    try:
+        if r.status_code != 200:
+            raise ValueError(f"HTTP {r.status_code}")
+        chunks = []
+        size = 0
+        for chunk in r.iter_content(1 << 16):
+            size += len(chunk)
+            if size > MAX_DOWNLOAD_BYTES:
+                raise ValueError("too large")
+            chunks.append(chunk)
+    finally:
+        r.close()
+    return b"".join(chunks)
+
+def pil_image():
+    # Pillow is imported on first use: the post step reads this cache but never decodes images
+    try:
+        from PIL import Image
+    except ImportError:  # without Pillow images are only sniffed, not measured or re-encoded
+        return None
+    return Image
+
+def normalize(data):
+    # Returns (bytes, ext, width, height); raises ValueError when the image can't be posted
+    kind = sniff(data)
+    if not kind:
+        raise ValueError("not an image")
+    Image = pil_image()
+    if Image is None:
+        if kind == "gif" or len(data) > TG_MAX_BYTES:
+            raise ValueError(f"unsupported {kind} ({len(data)} bytes)")
+        return data, EXTS[kind], 0, 0
+    try:
+        im = Image.open(io.BytesIO(data))
+        im.load()
+    except Exception as e:
+        raise ValueError(f"undecodable: {type(e).__name__}")
+    w, h = im.size
+    if min(w, h) < IMAGE_MIN_SIDE:
+        raise ValueError(f"too small ({w}x{h})")
+    if max(w, h) / min(w, h) > TG_MAX_RATIO:
+        raise ValueError(f"aspect ratio ({w}x{h})")
+    im.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    if im.mode in ("RGBA", "LA", "P"):
+        # Logos are mostly transparent PNGs; flatten on white so they don't turn black in JPEG
+        rgba = im.convert("RGBA")
+        im = Image.new("RGB", rgba.size, (255, 255, 255))
+        im.paste(rgba, mask=rgba.split()[-1])
+    elif im.mode != "RGB":
+        im = im.convert("RGB")
+    fmt = "webp" if IMAGE_FORMAT == "webp" else "jpeg"
+    out = io.BytesIO()
+    im.save(out, format=fmt.upper(), quality=IMAGE_QUALITY)
+    data = out.getvalue()
+    w, h = im.size
+    if len(data) > TG_MAX_BYTES or w + h > TG_MAX_SIDES:
+        raise ValueError(f"over Telegram limits ({w}x{h}, {len(data)} bytes)")
+    return data, EXTS[fmt], w, h
+
+def fetch_one(session, url):
+    record = {"ok": False, "checked_ts": int(time.time())}
+    host = urlparse(url).netloc.lower()
+    try:
+        with metrics.span("image_fetch", host=host):
+            data = download(session, url)
+        with metrics.span("image_normalize"):
+            data, ext, w, h = normalize(data)
+    except Exception as e:
+        record["error"] = str(e) if isinstance(e, ValueError) else type(e).__name__
+        metrics.count("image_check", outcome="unusable")
+        return record
+    metrics.count("image_check", outcome="ok")
+    # Content-addressed: the same logo behind several URLs is stored (and uploaded) once
+    sha = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha, ext)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    record.update({"ok": True, "sha": sha, "ext": ext, "width": w, "height": h, "bytes": len(data)})
+    return record
+
+def is_fresh(record, now=None):
+    if not record or not record.get("checked_ts"):
+        return False
+    now = now or time.time()
+    return now - record["checked_ts"] < IMAGE_TTL_DAYS * 86400
+
+def prefetch(urls, cache, force=False):
+    now = time.time()
+    todo = [u for u in urls if force or not is_fresh(cache["urls"].get(u), now)]
+    if not todo:
+        return cache
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=IMAGE_WORKERS, pool_maxsize=IMAGE_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    try:
+        with ThreadPoolExecutor(max_workers=IMAGE_WORKERS) as pool:
+            for url, record in zip(todo, pool.map(lambda u: fetch_one(session, u), todo)):
+                cache["urls"][url] = record
+    finally:
+        session.close()
+    return cache
+
+def photo_for(cache, url):
+    # What to hand Telegram for this image URL: (file_id | normalized bytes | url, key for the
+    # returned file_id), or ("", None) when the image is known to be unusable
+    if not url:
+        return "", None
+    rec = cache["urls"].get(url)
+    if rec and is_fresh(rec) and not rec.get("ok"):
+        return "", None
+    key = rec.get("sha") if rec and rec.get("ok") else url
+    known = cache["files"].get(key)
+    # A file_id keyed by sha always matches its bytes; one keyed by URL only while the URL is fresh
+    if known and (key != url or is_fresh(known)):
+        return known["file_id"], key
+    if key != url:
+        try:
+            with open(blob_path(key, rec["ext"]), "rb") as f:
+                return f.read(), key
+        except OSError:
+            pass
+    return url, key
+
+def file_id_of(message):
+    # Telegram returns every size it generated; the last one is the largest
+    sizes = (message or {}).get("photo") or []
+    return sizes[-1].get("file_id") if sizes else None
+
+def remember(cache, key, file_id):
+    if not key or not file_id or (cache["files"].get(key) or {}).get("file_id") == file_id:
+        return False
+    cache["files"][key] = {"file_id": file_id, "ts": int(time.time())}
+    return True
+
+def catalog_images(entries):
+    urls = []
+    seen = set()
+    for e in entries:
+        if e.get("status", "active") != "active":
+            continue
+        u = (e.get("image") or "").strip()
+        if u and not u.lower().endswith(".svg") and u not in seen:
+            seen.add(u)
+            urls.append(u)
+    return urls
+
+def main():
+    data = catalog.load_catalog()
+    cache = load_cache()
+    urls = catalog_images(data)
+    prefetch(urls, cache, force=FORCE_CHECK)
+    live = set(urls)
+    cache["urls"] = {u: r for u, r in cache["urls"].items() if u in live}
+    keep = live | {r.get("sha") for r in cache["urls"].values()}
+    cache["files"] = {k: v for k, v in cache["files"].items() if k in keep}
+    save_json(IMAGE_CACHE_FILE, cache, sort_keys=True)
+    ok = sum(1 for r in cache["urls"].values() if r.get("ok"))
+    print(f"Checked {len(urls)} images; {ok} usable, {len(cache['files'])} with a Telegram file_id.")
+
+if __name__ == "__main__":
+    metrics.run(main, "image_cache")
@@ -0,0 +1,21 @@
+import os
+import json
+
+# JSON state files shared by every script; stdlib only so any entry point can import it
+
+def load_json(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+def save_json(path, obj, sort_keys=False):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    # Write a sibling temp file and rename it over the target so a crash never leaves half a file
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2, sort_keys=sort_keys)
+    os.replace(tmp, path)
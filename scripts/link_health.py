@@ -0,0 +1,102 @@
+import os
+import time
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import catalog
+import domain_plugins
+import metrics
+from jsonio import load_json, save_json
+from config import LINK_HEALTH_FILE, HTTP_TIMEOUT
+
+LINK_HEALTH_TTL_HOURS = float(os.getenv("LINK_HEALTH_TTL_HOURS", "24"))
+LINK_HEALTH_WORKERS = max(1, int(os.getenv("LINK_HEALTH_WORKERS", "16")))
+FORCE_CHECK = os.getenv("FORCE_CHECK", "false").lower() == "true"
+
+def http_session(pool_size=LINK_HEALTH_WORKERS):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def check_url(session, url):
+    # HEAD first, then a streamed GET for servers that reject HEAD; redirects are followed once here
+    started = time.monotonic()
+    record = {"ok": False, "status": 0, "final_url": "", "redirects": 0}
+    try:
+        r = session.head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        if not (200 <= r.status_code < 400):
+            r = session.get(url, allow_redirects=True, timeout=HTTP_TIMEOUT, stream=True)
+            r.close()
+        record.update({
+            "ok": 200 <= r.status_code < 400,
+            "status": r.status_code,
+            "final_url": r.url,
+            "redirects": len(r.history),
+        })
+    except Exception as e:
+        record["error"] = type(e).__name__
+    elapsed = time.monotonic() - started
+    record["latency_ms"] = int(elapsed * 1000)
+    record["checked_ts"] = int(time.time())
+    # Labelled with the page the link lands on, not the affiliate redirector in front of it
+    host = urlparse(record["final_url"] or domain_plugins.redirect_target(url) or url).netloc.lower()
+    metrics.observe("link_check", elapsed, host=host)
+    metrics.count("link_check_outcome", outcome="ok" if record["ok"] else record.get("error") or f"http_{record['status']}")
+    return record
+
+def is_fresh(record, now=None):
+    if not record or not record.get("checked_ts"):
+        return False
+    now = now or time.time()
+    return now - record["checked_ts"] < LINK_HEALTH_TTL_HOURS * 3600
+
+def cached_verdict(cache, url, now=None):
+    # True/False from a fresh cache record, None when the URL has to be checked live
+    record = (cache or {}).get(url)
+    if not is_fresh(record, now):
+        return None
+    return bool(record.get("ok"))
+
+def catalog_urls(entries):
+    urls = []
+    seen = set()
+    for e in entries:
+        if e.get("status", "active") != "active":
+            continue
+        for l in e.get("links") or []:
+            u = (l.get("url") or "").strip()
+            if u and u not in seen:
+                seen.add(u)
+                urls.append(u)
+    return urls
+
+def check_all(urls, cache, force=False):
+    now = time.time()
+    todo = [u for u in urls if force or not is_fresh(cache.get(u), now)]
+    if not todo:
+        return cache
+    session = http_session()
+    try:
+        with ThreadPoolExecutor(max_workers=LINK_HEALTH_WORKERS) as pool:
+            for url, record in zip(todo, pool.map(lambda u: check_url(session, u), todo)):
+                cache[url] = record
+    finally:
+        session.close()
+    return cache
+
+def main():
+    data = catalog.load_catalog()
+    cache = load_json(LINK_HEALTH_FILE, default={}) or {}
+    urls = catalog_urls(data)
+    check_all(urls, cache, force=FORCE_CHECK)
+    # Drop URLs that left the catalog so the file doesn't grow forever
+    live = set(urls)
+    cache = {u: r for u, r in cache.items() if u in live}
+    save_json(LINK_HEALTH_FILE, cache, sort_keys=True)
+    bad = sum(1 for r in cache.values() if not r.get("ok"))
+    print(f"Checked {len(urls)} links; {bad} unhealthy.")
+
+if __name__ == "__main__":
+    metrics.run(main, "link_health")
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Spans, per-host latency histograms and outcome counters for the three scripts.
+# Nothing is written unless METRICS_FILE is set; "{script}" in the path becomes the script name.
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FORMAT = os.getenv("METRICS_FORMAT", "jsonl").lower()  # jsonl | prom (Prometheus textfile)
+# Optional profiler around the whole run: cprofile writes a .pstats file, pyinstrument an HTML report
+PROFILE = os.getenv("PROFILE", "").lower()  # "" | cprofile | pyinstrument
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> {"count", "sum", "max", "buckets": [..]}
+_counters = {}    # (name, labels) -> n
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None and v != ""))
+
+def observe(name, seconds, **labels):
+    key = (name, label_key(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+        h["count"] += 1
+        h["sum"] += seconds
+        h["max"] = max(h["max"], seconds)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h["buckets"][i] += 1
+
+def count(name, value=1, **labels):
+    key = (name, label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+@contextmanager
+def span(name, **labels):
+    # Times the block into the <name> histogram; works around awaits as well
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+def quantile(h, q):
+    # Upper bucket bound holding the q-th observation; max when it falls past the last bucket
+    target = q * h["count"]
+    for le, n in zip(BUCKETS, h["buckets"]):
+        if n >= target:
+            return le
+    return round(h["max"], 4)
+
+def snapshot():
+    with _lock:
+        hists = {k: dict(v, buckets=list(v["buckets"])) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    return hists, counters
+
+def jsonl_records(script, ts):
+    hists, counters = snapshot()
+    out = []
+    for (name, labels), h in sorted(hists.items()):
+        out.append({
+            "ts": ts, "script": script, "type": "histogram", "name": name, "labels": dict(labels),
+            "count": h["count"], "sum_s": round(h["sum"], 4), "max_s": round(h["max"], 4),
+            "p50_s": quantile(h, 0.5), "p95_s": quantile(h, 0.95),
+            "buckets": {str(le): n for le, n in zip(BUCKETS, h["buckets"])},
+        })
+    for (name, labels), n in sorted(counters.items()):
+        out.append({"ts": ts, "script": script, "type": "counter", "name": name, "labels": dict(labels), "value": n})
+    return out
+
+def prom_name(name):
+    return "bankbot_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def prom_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+def prom_text(script):
+    hists, counters = snapshot()
+    lines = []
+    typed = set()
+    for (name, labels), h in sorted(hists.items()):
+        metric = prom_name(name) + "_seconds"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        for le, n in zip(BUCKETS, h["buckets"]):
+            lines.append(f"{metric}_bucket{prom_labels(labels, script=script, le=le)} {n}")
+        lines.append(f"{metric}_bucket{prom_labels(labels, script=script, le='+Inf')} {h['count']}")
+        lines.append(f"{metric}_sum{prom_labels(labels, script=script)} {h['sum']:.6f}")
+        lines.append(f"{metric}_count{prom_labels(labels, script=script)} {h['count']}")
+    for (name, labels), n in sorted(counters.items()):
+        metric = prom_name(name) + "_total"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{prom_labels(labels, script=script)} {n}")
+    return "\n".join(lines) + "\n"
+
+def flush(script):
+    if not METRICS_FILE:
+        return
+    path = METRICS_FILE.replace("{script}", script)
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    if METRICS_FORMAT == "prom":
+        # The textfile collector reads whole files; replace it in one step
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prom_text(script))
+        os.replace(tmp, path)
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for rec in jsonl_records(script, int(time.time())):
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+def run(main, script):
+    # Entry point wrapper: optional profiler around main(), metrics flushed however it ends
+    profiler = None
+    if PROFILE == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif PROFILE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("PROFILE=pyinstrument but pyinstrument is not installed; running unprofiled")
+        else:
+            profiler = Profiler()
+            profiler.start()
+    try:
+        return main()
+    finally:
+        flush(script)
+        if profiler is not None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            if PROFILE == "cprofile":
+                profiler.disable()
+                out = os.path.join(PROFILE_DIR, f"{script}-{stamp}.pstats")
+                profiler.dump_stats(out)
+            else:
+                profiler.stop()
+                out = os.path.join(PROFILE_DIR, f"{script}-{stamp}.html")
+                with open(out, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+            print(f"Profile written to {out}")
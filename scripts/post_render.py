@@ -0,0 +1,146 @@
+import os
+import time
+import requests
+import link_health
+import domain_plugins
+import metrics
+import image_cache
+import shortener
+from catalog import best_link
+from jsonio import load_json, save_json
+from config import LINK_HEALTH_FILE, SHORT_URL_FILE, IMAGE_CACHE_FILE, MAX_CAPTION
+
+# Turns a queue item into what the post step sends. build_schedule renders the queue ahead of
+# time; post_to_telegram re-renders items whose render is missing or older than the TTL.
+RENDER_TTL_HOURS = float(os.getenv("RENDER_TTL_HOURS", "24"))
+
+def shorten(url):
+    # Pre-shortened at queue build time; only a cache miss goes out to the backend
+    cache = load_json(SHORT_URL_FILE, default={}) or {}
+    before = len(cache)
+    short = shortener.shorten(url, cache)
+    if len(cache) != before:
+        save_json(SHORT_URL_FILE, cache)
+    return short
+
+_link_health = None
+
+def url_ok(url):
+    # Prefer the verdict cached by link_health.py at build time; only probe live on a miss
+    global _link_health
+    if _link_health is None:
+        _link_health = load_json(LINK_HEALTH_FILE, default={}) or {}
+    verdict = link_health.cached_verdict(_link_health, url)
+    if verdict is not None:
+        metrics.count("link_verdict", source="cache")
+        return verdict
+    metrics.count("link_verdict", source="live")
+    session = requests.Session()
+    try:
+        record = link_health.check_url(session, url)
+    finally:
+        session.close()
+    _link_health[url] = record
+    return record["ok"]
+
+_images = None
+
+def images():
+    global _images
+    if _images is None:
+        _images = image_cache.load_cache(IMAGE_CACHE_FILE)
+    return _images
+
+def photo_source(img):
+    # file_id from an earlier upload, prefetched bytes, or the URL itself; "" for known-bad images
+    return image_cache.photo_for(images(), img)
+
+def remember_photos(keys, messages):
+    # Later posts of the same image reuse Telegram's file_id instead of re-sending it
+    changed = False
+    for key, msg in zip(keys, messages):
+        changed = image_cache.remember(images(), key, image_cache.file_id_of(msg)) or changed
+    if changed:
+        save_json(IMAGE_CACHE_FILE, images())
+
+def apply_link_policy(entry, url):
+    # Per-host rules come from data/domain_plugins.json; hosts without a plugin pass through
+    plugin = domain_plugins.lookup(url)
+    policy = (plugin or {}).get("link")
+    if not policy or not domain_plugins.matches(policy, entry):
+        return url
+    if policy.get("replace_with"):
+        return policy["replace_with"]
+    if policy.get("fallback_if_unhealthy") and not url_ok(url):
+        return policy["fallback_if_unhealthy"]
+    # Skip paused/broken campaigns
+    if policy.get("drop_if_unhealthy") and not url_ok(url):
+        return ""
+    return url
+
+def build_caption_photo(entry, short_url):
+    # For photo captions (no clickable anchor), keep it concise with visible short URL
+    title = entry.get("offer_snippet") or entry.get("name") or "Offer"
+    offers = entry.get("offers", [])[:3]
+    bullets = "\n".join(f"-  {o}" for o in offers) if offers else ""
+    tags = entry.get("tags", [])
+    tag_line = f"\nTags: {', '.join(tags[:5])}" if tags else ""
+    caption = (
+        f"🏦 {title}\n"
+        f"{bullets}\n\n"
+        f"Apply/Know more: {short_url}{tag_line}\n"
+        f"(Disclosure: Affiliate link)"
+    ).strip()
+    return caption[:MAX_CAPTION]
+
+def build_message_html(entry, short_url):
+    # For text messages: richer formatting and clickable CTA
+    title = entry.get("offer_snippet") or entry.get("name") or "Offer"
+    offers = entry.get("offers", [])[:3]
+    bullets = "\n".join(f"-  {o}" for o in offers) if offers else ""
+    tags = entry.get("tags", [])
+    tag_line = f"\nTags: {', '.join(tags[:5])}" if tags else ""
+    body = (
+        f"🏦 <b>{title}</b>\n"
+        f"{bullets}\n\n"
+        f'<a href="{short_url}">Click here to apply</a>{tag_line}\n'
+        f"(Disclosure: Affiliate link)"
+    ).strip()
+    return body
+
+def choose_image(entry):
+    img = (entry.get("image") or "").strip()
+    if img and img.lower().endswith(".svg"):
+        img = ""
+    if not img:
+        plugin = domain_plugins.lookup(best_link(entry.get("links", [])), follow_redirect=True)
+        if plugin and plugin.get("image_override"):
+            img = plugin["image_override"]
+    return img
+
+def render(item, now=None):
+    # Everything the post step needs, precomputed: link policy, short URL, image and both captions
+    now = now or time.time()
+    rendered = {"valid_until": int(now + RENDER_TTL_HOURS * 3600)}
+    url = best_link(item.get("links", []))
+    if not url:
+        rendered["skip"] = "no link"
+        return rendered
+    url = apply_link_policy(item, url)
+    if not url:
+        rendered["skip"] = "paused/bad campaign link"
+        return rendered
+    short_url = shorten(url)
+    img = choose_image(item)
+    photo, key = photo_source(img)
+    rendered.update({
+        "url": url,
+        "short_url": short_url,
+        "image": img if photo else "",
+        "image_key": key,
+        "caption": build_caption_photo(item, short_url),
+        "html": build_message_html(item, short_url),
+    })
+    if isinstance(photo, str) and photo and photo != img:
+        rendered["file_id"] = photo
+    return rendered
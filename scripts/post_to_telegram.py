@@ -1,220 +1,345 @@
 import os
-import json
+import sys
 import time
 import random
-import requests
-from urllib.parse import urlparse
-
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
-TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID", "")
-DATA_FILE = os.getenv("DATA_FILE", "data/bank_offers.json")
-ENRICHED_FILE = os.getenv("ENRICHED_FILE", "data/bank_offers.enriched.json")
-QUEUE_FILE = os.getenv("QUEUE_FILE", "data/today_queue.json")
-HISTORY_FILE = os.getenv("HISTORY_FILE", "data/post_history.json")
-
-# Telegram photo caption has a hard cap around 1,024 chars; messages allow ~4,096 chars.
-MAX_CAPTION = 1000
-HTTP_TIMEOUT = 15
-
-# Known-good link overrides (extend as needed)
-LINK_OVERRIDES = {
-    "axisbank_verification": "https://linksredirect.com/?cid=241055&source=linkkit&url=https%3A%2F%2Fleap.axisbank.com%2Fverification",
-    "axis_mf_micro": "https://linksredirect.com/?cid=241055&source=linkkit&url=https%3A%2F%2Fwww.axismf.com%2Fmicro-investing",
-}
-
-# Treat some hosts as risky if campaigns are frequently paused
-PAUSED_HOSTS = {
-    "www.cuelinks.com",
-    "cuelinks.com",
-}
-
-# Optional per-merchant image overrides (use CDN high-quality images)
-IMAGE_OVERRIDES = {
-    # "play.google.com": "https://yourcdn.com/brands/google-play-card.jpg",
-    # "leap.axisbank.com": "https://yourcdn.com/brands/axis-hero.jpg",
-}
-
-def load_json(path, default=None):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
-
-def save_json(path, obj):
-    d = os.path.dirname(path)
-    if d:
-        os.makedirs(d, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-
-def best_link(links):
-    if not links:
-        return ""
-    official = [l for l in links if l.get("type") == "official" and l.get("url")]
-    if official:
-        item = official[0] if isinstance(official, list) else official
-        return item.get("url", "") if isinstance(item, dict) else item
-    for l in links:
-        if l.get("url"):
-            return l["url"]
-    return ""
-
-def hostname(url):
-    try:
-        return urlparse(url).netloc.lower()
-    except Exception:
-        return ""
+import datetime
+import metrics
+import history_store
+import catalog
+import build_schedule
+import telegram_sender
+from timeutil import IST, ist_now, ist_today
+from post_render import render, photo_source, remember_photos
+from jsonio import load_json, save_json
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, QUEUE_FILE, POST_HISTORY_FILE, SCHEDULE_HISTORY_FILE,
+    SCHEDULE_FILE, MAX_CAPTION,
+)
 
-def shorten(url):
-    try:
-        r = requests.get("https://tinyurl.com/api-create.php", params={"url": url}, timeout=HTTP_TIMEOUT)
-        if r.status_code == 200 and r.text.startswith("http"):
-            return r.text.strip()
-    except Exception:
-        pass
-    return url
-
-def url_ok(url):
-    try:
-        r = requests.head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
-        if 200 <= r.status_code < 400:
-            return True
-        r = requests.get(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
-        return (200 <= r.status_code < 400)
-    except Exception:
-        return False
-
-def apply_link_policy(entry, url):
-    name_l = (entry.get("name") or "").lower()
-    tags = set((entry.get("tags") or []))
-    host = hostname(url)
-
-    # Axis overrides
-    if "axis" in tags or "axis" in name_l:
-        if "getlasso.co" in url or "cloudflare" in url or "cloudflare" in name_l:
-            url = LINK_OVERRIDES["axisbank_verification"]
-        if "axisbank.com" in url and not url_ok(url):
-            url = LINK_OVERRIDES["axisbank_verification"]
-
-    # Skip paused/broken Cuelinks if unhealthy
-    if host in PAUSED_HOSTS and not url_ok(url):
-        return ""
-
-    return url
-
-def build_caption_photo(entry, short_url):
-    # For photo captions (no clickable anchor), keep it concise with visible short URL
-    title = entry.get("offer_snippet") or entry.get("name") or "Offer"
-    offers = entry.get("offers", [])[:3]
-    bullets = "\n".join(f"-  {o}" for o in offers) if offers else ""
-    tags = entry.get("tags", [])
-    tag_line = f"\nTags: {', '.join(tags[:5])}" if tags else ""
-    caption = (
-        f"🏦 {title}\n"
-        f"{bullets}\n\n"
-        f"Apply/Know more: {short_url}{tag_line}\n"
-        f"(Disclosure: Affiliate link)"
-    ).strip()
-    return caption[:MAX_CAPTION]
-
-def build_message_html(entry, short_url):
-    # For text messages: richer formatting and clickable CTA
-    title = entry.get("offer_snippet") or entry.get("name") or "Offer"
-    offers = entry.get("offers", [])[:3]
-    bullets = "\n".join(f"-  {o}" for o in offers) if offers else ""
-    tags = entry.get("tags", [])
-    tag_line = f"\nTags: {', '.join(tags[:5])}" if tags else ""
-    body = (
-        f"🏦 <b>{title}</b>\n"
-        f"{bullets}\n\n"
-        f'<a href="{short_url}">Click here to apply</a>{tag_line}\n'
-        f"(Disclosure: Affiliate link)"
-    ).strip()
-    return body
+# cron: one post per run after a random 0..POST_JITTER_S delay; daemon: stay up and post at post_times_ist
+POST_MODE = os.getenv("POST_MODE", "once").lower()  # once | drain | daemon
+DRAIN_MAX = int(os.getenv("DRAIN_MAX", "50"))
+# Drain as sendMediaGroup albums (also on schedule_config "album_days")
+ALBUM = os.getenv("ALBUM", "false").lower() == "true"
+ALBUM_SIZE = max(2, min(10, int(os.getenv("ALBUM_SIZE", "10"))))
+POST_JITTER_S = int(os.getenv("POST_JITTER_S", "60"))
+DAEMON_STATE_FILE = os.getenv("DAEMON_STATE_FILE", "data/daemon_state.json")
+MISSED_GRACE_MIN = int(os.getenv("MISSED_GRACE_MIN", "30"))
+DEFAULT_POST_TIMES = ["11:45", "17:45", "23:45"]
+
+_sender = None
+
+def sender():
+    # One pooled session + rate limiter per process; drain and daemon modes reuse it for every post
+    global _sender
+    if _sender is None:
+        _sender = telegram_sender.Sender(TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID)
+    return _sender
 
 def post_text_html(text):
-    api = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHANNEL_ID,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": False
-    }
-    r = requests.post(api, json=payload, timeout=HTTP_TIMEOUT)
-    r.raise_for_status()
-
-def post_photo(photo_url, caption):
-    api = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-    data = {"chat_id": TELEGRAM_CHANNEL_ID, "photo": photo_url, "caption": caption}
-    r = requests.post(api, data=data, timeout=HTTP_TIMEOUT)
-    if r.status_code >= 400:
-        post_text_html(caption)  # fallback without HTML formatting
+    return sender().send_message(text, parse_mode="HTML")
 
-def pick_next_from_queue():
+def post_photo(photo, caption, key=None):
+    try:
+        msg = sender().send_photo(photo, caption)
+        remember_photos([key], [msg])
+        return "photo"
+    except telegram_sender.TelegramError as e:
+        # Throttling or a Telegram outage would fail the text too; let the caller requeue
+        if e.retryable:
+            raise
+        print(f"Photo failed ({e}); sending caption as text")
+        sender().send_message(caption, parse_mode=None)  # fallback without HTML formatting
+        return "text_fallback"
+
+def take_from_queue(n):
     q = load_json(QUEUE_FILE, default=[])
-    if not q:
-        return None, []
-    item = q.pop(0)
+    today = ist_today().isoformat()
+    # Leftovers of an earlier day are stale; switch over to today's plan when there is one
+    if not q or (q[0].get("plan_date") or today) < today:
+        planned = build_schedule.take_planned_day(today)
+        if planned or not q:
+            q = planned
+    items, q = q[:n], q[n:]
     save_json(QUEUE_FILE, q)
-    return item, q
-
-def add_history(entry):
-    hist = load_json(HISTORY_FILE, default=[])
-    hist.append({"name": entry.get("name"), "ts": int(time.time())})
-    hist = hist[-1000:]
-    save_json(HISTORY_FILE, hist)
-
-def choose_image(entry):
-    img = (entry.get("image") or "").strip()
-    if img and img.lower().endswith(".svg"):
-        img = ""
-    if not img:
-        host = hostname(best_link(entry.get("links", [])))
-        override = IMAGE_OVERRIDES.get(host)
-        if override:
-            img = override
-    return img
-
-def dispatch(item, short_url, img):
-    caption_photo = build_caption_photo(item, short_url)
-    message_html = build_message_html(item, short_url)
-    if img and len(caption_photo) <= MAX_CAPTION:
-        post_photo(img, caption_photo)
+    return items, q
+
+def pick_next_from_queue():
+    items, q = take_from_queue(1)
+    if not items:
+        return None, []
+    return items[0], q
+
+def requeue(items):
+    if isinstance(items, dict):
+        items = [items]
+    q = load_json(QUEUE_FILE, default=[]) or []
+    save_json(QUEUE_FILE, list(items) + q)
+
+def add_history(entry, status=None):
+    rec = {"name": entry.get("name"), "ts": int(time.time())}
+    if entry.get("id"):
+        rec["id"] = entry["id"]
+    if status:
+        rec["status"] = status
+    history_store.append(POST_HISTORY_FILE, rec)
+
+def resolve(item):
+    # The item's build-time render while still valid, otherwise a fresh one; None when it must be skipped
+    rendered = item.get("render")
+    if not rendered or rendered.get("valid_until", 0) < time.time():
+        with metrics.span("render"):
+            rendered = render(item)
+        metrics.count("render", source="post_step")
     else:
-        post_text_html(message_html)
+        metrics.count("render", source="queue")
+    if rendered.get("skip"):
+        metrics.count("post_skip", reason=rendered["skip"])
+        print(f"Skipping {item.get('name')}: {rendered['skip']}")
+        return None
+    return rendered
 
-def main():
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
-        print("Missing TELEGRAM_BOT_TOKEN or TELEGRAM_CHANNEL_ID")
-        return
+def photo_of(rendered):
+    # A file_id learned since the build wins over the one rendered into the queue
+    photo, key = photo_source(rendered.get("image"))
+    if not photo or photo == rendered.get("image"):
+        photo = rendered.get("file_id") or photo
+    return photo, key or rendered.get("image_key")
+
+def dispatch(item, rendered):
+    photo, key = photo_of(rendered)
+    if photo and len(rendered["caption"]) <= MAX_CAPTION:
+        kind = post_photo(photo, rendered["caption"], key)
+    else:
+        post_text_html(rendered["html"])
+        kind = "text"
+    metrics.count("post_kind", kind=kind)
+    return kind
 
+def post_next(fallback_random=True):
+    # Returns one of: posted, skipped, failed, requeued, empty
+    with metrics.span("post"):
+        status = post_one(fallback_random)
+    metrics.count("post_result", result=status)
+    return status
+
+def post_one(fallback_random):
     item, remaining = pick_next_from_queue()
-    if not item:
-        data = load_json(ENRICHED_FILE) or load_json(DATA_FILE) or []
-        active = [e for e in data if e.get("status", "active") == "active"]
+    from_queue = bool(item)
+    if not item and fallback_random:
+        data = catalog.load_catalog()
+        active = [e for e in data if e.get("status", "active") == "active" and not e.get("duplicate_of")]
         item = random.choice(active) if active else None
-        if not item:
-            print("No item to post")
-            return
+    if not item:
+        print("No item to post")
+        return "empty"
 
-    url = best_link(item.get("links", []))
-    if not url:
-        print("No link for item; skipping")
+    rendered = resolve(item)
+    if not rendered:
+        return "skipped"
+    try:
+        dispatch(item, rendered)
+    except telegram_sender.TelegramError as e:
+        if e.retryable and from_queue:
+            requeue(item)
+            print(f"Send failed after retries, put back on the queue: {item.get('name')} ({e})")
+            return "requeued"
+        add_history(item, status="error")
+        print(f"Send failed: {item.get('name')} ({e})")
+        return "failed"
+
+    add_history(item)
+    print(f"Posted: {item.get('name')} | Remaining today: {len(remaining)}")
+    return "posted"
+
+def build_album_cta(posts):
+    lines = [f'{n}. <a href="{r["short_url"]}">{item.get("name") or "Offer"}</a>' for n, (item, r) in enumerate(posts, 1)]
+    return ("🏦 <b>Apply / know more</b>\n" + "\n".join(lines) + "\n(Disclosure: Affiliate links)")[:4096]
+
+def post_album(posts):
+    # posts: [(item, rendered)], 2..10 photos. Returns (sent_items, unsent_posts);
+    # unsent is only non-empty when Telegram keeps failing transiently.
+    media, files, keys = [], {}, []
+    for n, (item, rendered) in enumerate(posts):
+        photo, key = photo_of(rendered)
+        if isinstance(photo, bytes):
+            files[f"photo{n}"] = photo
+            photo = f"attach://photo{n}"
+        media.append({"type": "photo", "media": photo, "caption": rendered["caption"]})
+        keys.append(key)
+    try:
+        messages = sender().send_media_group(media, files=files)
+    except telegram_sender.TelegramError as e:
+        metrics.count("album", result="retry_later" if e.retryable else "rejected")
+        if e.retryable:
+            return [], posts
+        # Telegram rejects the whole album if any image is bad and doesn't say which; go one by one
+        print(f"Album rejected ({e}); sending {len(posts)} items individually")
+        return post_each(posts)
+    metrics.count("album", result="sent")
+    remember_photos(keys, messages or [])
+    try:
+        post_text_html(build_album_cta(posts))
+    except telegram_sender.TelegramError as e:
+        print(f"Album went out but the CTA message failed ({e})")
+    return [item for item, _ in posts], []
+
+def post_each(posts):
+    sent = []
+    for i, (item, rendered) in enumerate(posts):
+        try:
+            dispatch(item, rendered)
+        except telegram_sender.TelegramError as e:
+            if e.retryable:
+                return sent, posts[i:]
+            add_history(item, status="error")
+            print(f"Send failed: {item.get('name')} ({e})")
+            continue
+        sent.append(item)
+    return sent, []
+
+def drain_albums():
+    counts = {}
+    while True:
+        items, _ = take_from_queue(ALBUM_SIZE)
+        if not items:
+            break
+        photos, texts = [], []
+        for item in items:
+            rendered = resolve(item)
+            if not rendered:
+                counts["skipped"] = counts.get("skipped", 0) + 1
+                continue
+            if photo_of(rendered)[0] and len(rendered["caption"]) <= MAX_CAPTION:
+                photos.append((item, rendered))
+            else:
+                texts.append((item, rendered))
+        if len(photos) == 1:
+            texts.insert(0, photos.pop())
+
+        sent, unsent = post_album(photos) if photos else ([], [])
+        if not unsent:
+            more, unsent = post_each(texts)
+            sent += more
+        else:
+            unsent += texts
+        for item in sent:
+            add_history(item)
+        counts["posted"] = counts.get("posted", 0) + len(sent)
+        if unsent:
+            requeue([p[0] for p in unsent])
+            counts["requeued"] = len(unsent)
+            print(f"Sends keep failing; put {len(unsent)} items back on the queue")
+            break
+    print("Drain:", counts)
+
+def album_day():
+    config = load_json(SCHEDULE_FILE, default={}) or {}
+    return build_schedule.WEEKDAYS[ist_today().weekday()] in (config.get("album_days") or [])
+
+def drain():
+    # Posts the whole queue in one process; the sender's rate limiter does the pacing
+    if ALBUM or album_day():
+        drain_albums()
         return
+    counts = {}
+    for _ in range(DRAIN_MAX):
+        status = post_next(fallback_random=False)
+        counts[status] = counts.get(status, 0) + 1
+        if status in ("empty", "requeued"):
+            break
+    print("Drain:", counts)
 
-    url = apply_link_policy(item, url)
-    if not url:
-        print("Skipping item due to paused/bad campaign link")
+def slot_time(day, hhmm, jitter_s):
+    # Jitter is seeded by the slot so a restarted daemon lands on the same time
+    h, m = (int(x) for x in hhmm.split(":"))
+    base = datetime.datetime(day.year, day.month, day.day, h, m, tzinfo=IST)
+    jitter = random.Random(f"{day.isoformat()}|{hhmm}").randint(0, max(0, jitter_s))
+    return base + datetime.timedelta(seconds=jitter)
+
+def next_slot(config, state, now):
+    times = config.get("post_times_ist") or DEFAULT_POST_TIMES
+    jitter_s = int(config.get("post_jitter_s", POST_JITTER_S))
+    grace = datetime.timedelta(minutes=MISSED_GRACE_MIN)
+    today = now.astimezone(IST).date()
+    for offset in range(0, 3):
+        day = today + datetime.timedelta(days=offset)
+        done = set((state.get("slots") or {}).get(day.isoformat(), []))
+        for hhmm in sorted(times):
+            if hhmm in done:
+                continue
+            when = slot_time(day, hhmm, jitter_s)
+            if when + grace < now:
+                continue  # missed while down; don't burst-post on restart
+            return day.isoformat(), hhmm, when
+    return None, None, None
+
+def mark_slot(state, day, hhmm):
+    slots = state.setdefault("slots", {})
+    slots.setdefault(day, []).append(hhmm)
+    # Only the last week of slot bookkeeping is worth keeping
+    for d in sorted(slots)[:-7]:
+        slots.pop(d)
+    save_json(DAEMON_STATE_FILE, state)
+
+def ensure_day_queue(config, state, day):
+    # At day rollover the daemon does what the morning cron would: take the day's planned
+    # items or pick a fresh queue from the calendar rules and rotation memory
+    if state.get("queue_day") == day:
         return
+    queue = load_json(QUEUE_FILE, default=[]) or []
+    # On first start only a queue built for this very day is kept
+    if "queue_day" not in state and queue and queue[0].get("plan_date") == day:
+        print("Using the existing queue for today")
+    else:
+        history = history_store.load_index(SCHEDULE_HISTORY_FILE)
+        queue = build_schedule.build_day_queue(catalog.load_catalog(), config, history)
+        print(f"Built queue with {len(queue)} items for {day}")
+    state["queue_day"] = day
+    save_json(DAEMON_STATE_FILE, state)
 
-    short_url = shorten(url)
-    img = choose_image(item)
-    dispatch(item, short_url, img)
+async def run_daemon():
+    import asyncio
+    config = load_json(SCHEDULE_FILE, default={}) or {}
+    state = load_json(DAEMON_STATE_FILE, default={}) or {}
+    print(f"Daemon up; posting at {config.get('post_times_ist') or DEFAULT_POST_TIMES} IST")
+    while True:
+        now = ist_now()
+        day, hhmm, when = next_slot(config, state, now)
+        if not when:
+            await asyncio.sleep(3600)
+            continue
+        delay = (when - now).total_seconds()
+        if delay > 0:
+            # Sleep in bounded steps so clock jumps and suspend/resume are picked up
+            await asyncio.sleep(min(delay, 600))
+            continue
+        try:
+            ensure_day_queue(config, state, day)
+            # Only queued items go out: a random pick would ignore the calendar and rotation memory
+            await asyncio.to_thread(post_next, False)
+        except Exception as e:
+            print(f"Post for {day} {hhmm} failed: {e}")
+        mark_slot(state, day, hhmm)
+        metrics.flush("post")
 
-    add_history(item)
-    print(f"Posted: {item.get('name')} | Remaining today: {len(remaining)}")
+def main():
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
+        print("Missing TELEGRAM_BOT_TOKEN or TELEGRAM_CHANNEL_ID")
+        return
+    if POST_MODE == "drain" or "--drain" in sys.argv[1:]:
+        drain()
+        return
+    if POST_MODE == "daemon" or "--daemon" in sys.argv[1:]:
+        # asyncio is only needed by the daemon; once/drain runs skip its import
+        import asyncio
+        try:
+            asyncio.run(run_daemon())
+        except KeyboardInterrupt:
+            pass
+        return
+    time.sleep(random.randint(0, POST_JITTER_S))
+    post_next()
 
 if __name__ == "__main__":
-    time.sleep(random.randint(0, 60))
-    main()
+    metrics.run(main, "post")
@@ -1,34 +1,82 @@
 import os
-import json
 import re
 import time
+import json
+import hashlib
+import difflib
 from urllib.parse import urljoin, urlparse
 import asyncio
-from playwright.async_api import async_playwright
+import requests
 from bs4 import BeautifulSoup
+import catalog
+import history_store
+import domain_plugins
+import dedup
+import metrics
+from catalog import best_link, hostname
+from jsonio import load_json, save_json
+from config import (
+    DATA_FILE, ENRICHED_FILE, FETCH_CACHE_FILE, FETCH_TIERS_FILE, OFFER_CHANGES_FILE, ENRICH_JOURNAL_FILE,
+    HTTP_TIMEOUT, USER_AGENT,
+)
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
-DATA_FILE = os.getenv("DATA_FILE", "data/bank_offers.json")
-OUT_FILE = os.getenv("OUT_FILE", "data/bank_offers.enriched.json")
+OUT_FILE = ENRICHED_FILE
 FORCE_REFRESH = os.getenv("FORCE_REFRESH", "false").lower() == "true"
 NAV_TIMEOUT_MS = int(os.getenv("NAV_TIMEOUT_MS", "45000"))
-JS_WAIT_MS = int(os.getenv("JS_WAIT_MS", "4000"))
+JS_WAIT_MS = int(os.getenv("JS_WAIT_MS", "4000"))  # upper bound in adaptive mode
+WAIT_MODE = os.getenv("WAIT_MODE", "adaptive").lower()  # adaptive | fixed
+WAIT_MIN_TEXT_NODES = int(os.getenv("WAIT_MIN_TEXT_NODES", "8"))
+# Resource types aborted in the browser; images stay allowed for image metadata
+BLOCK_RESOURCES = {t.strip() for t in os.getenv("BLOCK_RESOURCES", "media,font").split(",") if t.strip()}
+# Pages in flight overall, per bank host, and browser contexts to spread them over
+CONCURRENCY = max(1, int(os.getenv("CONCURRENCY", "8")))
+PER_HOST_CONCURRENCY = max(1, int(os.getenv("PER_HOST_CONCURRENCY", "2")))
+CONTEXTS = max(1, int(os.getenv("CONTEXTS", "2")))
+# Incremental mode: only re-render entries that are stale and whose page changed
+INCREMENTAL = os.getenv("INCREMENTAL", "false").lower() == "true"
+# STALE_DAYS applies one window to every product type; unset, STALE_DAYS_BY_TYPE decides
+STALE_DAYS = os.getenv("STALE_DAYS", "").strip()
+# Tiered fetch: try a plain HTTP fetch first and only render in Chromium when it comes up empty
+FETCH_TIER = os.getenv("FETCH_TIER", "auto").lower()  # auto | js
+TIER_TTL_DAYS = int(os.getenv("TIER_TTL_DAYS", "30"))
+JS_HOSTS = {h.strip().lower() for h in os.getenv("JS_HOSTS", "").split(",") if h.strip()}
+# Resume: entries finished by an interrupted run within this window are not scraped again
+RESUME_MAX_AGE_H = float(os.getenv("RESUME_MAX_AGE_H", "24"))
+
+# Days an enriched entry stays fresh before we look at its page again; the STALE_DAYS_BY_TYPE
+# env (JSON, e.g. {"loan": 7}) overrides single types
+STALE_DAYS_BY_TYPE = {
+    "credit_card": 7,
+    "loan": 14,
+    "fintech_app": 14,
+    "other": 14,
+    "savings_account": 30,
+    "investment": 30,
+}
+STALE_DAYS_BY_TYPE.update(json.loads(os.getenv("STALE_DAYS_BY_TYPE") or "{}"))
+DEFAULT_STALE_DAYS = 7
+
+# Analytics/tracker hosts never needed for extraction (subdomains match too)
+BLOCK_HOSTS = {
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googleadservices.com",
+    "googlesyndication.com", "facebook.net", "connect.facebook.net", "hotjar.com", "clarity.ms",
+    "bat.bing.com", "analytics.twitter.com", "ads.linkedin.com", "snap.licdn.com", "moengage.com",
+    "clevertap-prod.com", "webengage.com", "mixpanel.com", "segment.io", "branch.io", "adobedtm.com",
+    "omtrdc.net", "demdex.net", "newrelic.com", "nr-data.net", "criteo.com", "taboola.com",
+} | {h.strip().lower() for h in os.getenv("BLOCK_HOSTS", "").split(",") if h.strip()}
 
 BANK_KEYWORDS = [
     "cashback", "reward", "rewards", "points", "miles", "fuel", "octane", "bpcl",
     "lounge", "joining fee", "annual fee", "waived", "waiver", "lifetime free",
     "welcome bonus", "offer", "discount", "save", "cash back", "%"
 ]
-
-def best_link(links):
-    if not links:
-        return ""
-    official = [l.get("url") for l in links if l.get("type") == "official" and l.get("url")]
-    if official:
-        return official[0] if isinstance(official, list) else official
-    for l in links:
-        if l.get("url"):
-            return l["url"]
-    return ""
+KEYWORD_RE = re.compile("|".join(re.escape(k) for k in sorted(BANK_KEYWORDS, key=len, reverse=True)), re.I)
 
 def looks_valid_img(src):
     if not src or not src.strip():
@@ -42,102 +90,186 @@ def absolutize(base, src):
         return src
     return urljoin(base, src)
 
-def extract_offer_snippet(soup: BeautifulSoup) -> str:
-    ogt = soup.find("meta", property="og:title")
-    desc = soup.find("meta", attrs={"name": "description"})
-    if ogt and ogt.get("content"):
-        t = (ogt.get("content") or "").strip()
-        if desc and desc.get("content"):
-            d = (desc.get("content") or "").strip()
-            if d:
-                return (f"{t} — {d}")[:220]
+def parse_page(html, plugin=None):
+    # One walk over the DOM collects everything the extractors below need; whatever a
+    # domain plugin's selectors already found is left out of the walk
+    soup = BeautifulSoup(html, HTML_PARSER)
+    doc = {"soup": soup, "meta": {}, "title": "", "heading": None, "offers": [], "header_imgs": [], "imgs": []}
+    if domain_plugins.extracts(plugin):
+        domain_plugins.apply(plugin, soup, doc)
+    names = ["meta", "title", "h1", "h2"]
+    if not doc["offers"]:
+        names += ["li", "p"]
+    if not doc.get("plugin_image"):
+        names.append("img")
+    seen = set()
+    for el in soup.find_all(tuple(names)):
+        tag = el.name
+        if tag == "li" or tag == "p":
+            if len(doc["offers"]) >= 12:
+                continue
+            txt = el.get_text(" ", strip=True)
+            if 15 <= len(txt) <= 240 and KEYWORD_RE.search(txt):
+                txt = re.sub(r"\s+", " ", txt)
+                if txt not in seen:
+                    seen.add(txt)
+                    doc["offers"].append(txt)
+        elif tag == "meta":
+            key = (el.get("property") or el.get("name") or "").lower()
+            if key and key not in doc["meta"]:
+                doc["meta"][key] = (el.get("content") or "").strip()
+        elif tag == "img":
+            src = (el.get("src") or "").strip()
+            if len(doc["imgs"]) < 12:
+                doc["imgs"].append(src)
+            if len(doc["header_imgs"]) < 12 and el.find_parent(("header", "nav")):
+                doc["header_imgs"].append(src)
+        elif tag == "title":
+            if not doc["title"]:
+                doc["title"] = el.get_text().strip()
+        elif doc["heading"] is None:
+            doc["heading"] = el.get_text(strip=True)
+    return doc
+
+def extract_offer_snippet(doc) -> str:
+    if doc.get("plugin_snippet"):
+        return doc["plugin_snippet"][:220]
+    t = doc["meta"].get("og:title", "")
+    d = doc["meta"].get("description", "")
+    if t:
+        if d:
+            return (f"{t} — {d}")[:220]
         return t[:220]
-    if soup.title and soup.title.text:
-        t = soup.title.text.strip()
-        if t:
-            return t[:220]
-    h = soup.find(["h1", "h2"])
-    if h and h.get_text(strip=True):
-        return h.get_text(strip=True)[:220]
-    if desc and desc.get("content"):
-        return (desc.get("content") or "").strip()[:220]
+    if doc["title"]:
+        return doc["title"][:220]
+    if doc["heading"]:
+        return doc["heading"][:220]
+    if d:
+        return d[:220]
     return ""
 
-def extract_offers_texts(soup: BeautifulSoup):
-    items = []
-    for el in soup.select("li, p"):
-        txt = el.get_text(" ", strip=True)
-        if not txt:
-            continue
-        low = txt.lower()
-        if any(k in low for k in BANK_KEYWORDS):
-            if 15 <= len(txt) <= 240:
-                txt = re.sub(r"\s+", " ", txt)
-                if txt not in items:
-                    items.append(txt)
-        if len(items) >= 12:
-            break
-    return items[:8]
+def extract_offers_texts(doc):
+    # Collapse repeated menu/banner variants before capping, so they don't use up the 8 slots
+    return dedup.dedup_lines(doc["offers"])[:8]
 
-def prefer_domain_specific_image(url, soup):
-    try:
-        host = urlparse(url).netloc.lower()
-    except Exception:
-        host = ""
-    # Specific grab for Scapia site "Benefits Grid"
-    if "apply.scapia.cards" in host:
-        cand = soup.select_one('img[src*="res.cloudinary.com"][src*="spitha_prod_uploads"][src$=".webp"]')
-        if cand and cand.get("src"):
-            return cand.get("src").strip()
+def offer_region_hash(doc):
+    # Normalized text of everything the offer extractors read, so banners, tokens and
+    # timestamps elsewhere on the page don't count as a change
+    parts = [doc.get("plugin_snippet", ""), doc["meta"].get("og:title", ""), doc["meta"].get("description", ""), doc["title"], doc["heading"] or ""]
+    text = "\n".join(re.sub(r"\s+", " ", p).strip().lower() for p in parts + doc["offers"])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def offers_unchanged(entry, region):
+    return not FORCE_REFRESH and region == entry.get("offer_hash") and bool(entry.get("offer_snippet"))
+
+def normalize_offer(text):
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+def diff_offers(old, new):
+    # Exact (normalized) matches are unchanged; the closest leftover pairs count as edits
+    old_n = {normalize_offer(o): o for o in old or []}
+    new_n = {normalize_offer(o): o for o in new or []}
+    removed = [k for k in old_n if k not in new_n]
+    added = [k for k in new_n if k not in old_n]
+    changed = []
+    for k in list(removed):
+        best, ratio = None, 0.0
+        for a in added:
+            r = difflib.SequenceMatcher(None, k, a).ratio()
+            if r > ratio:
+                best, ratio = a, r
+        if best is not None and ratio >= 0.6:
+            changed.append({"from": old_n[k], "to": new_n[best]})
+            removed.remove(k)
+            added.remove(best)
+    return {"added": [new_n[k] for k in added], "removed": [old_n[k] for k in removed], "changed": changed}
+
+def entry_change(previous, entry, now):
+    # previous: (offer_hash, offers, offer_snippet) captured before the run
+    old_hash, old_offers, old_snippet = previous
+    if not old_offers or entry.get("offer_hash") in (None, old_hash):
+        return None
+    diff = diff_offers(old_offers, entry.get("offers"))
+    if old_snippet != entry.get("offer_snippet", ""):
+        diff["snippet"] = {"from": old_snippet, "to": entry.get("offer_snippet", "")}
+    if not any(diff.values()):
+        return None
+    entry["offers_changed_ts"] = now
+    return dict(diff, id=catalog.entry_id(entry), name=entry.get("name"), ts=now)
+
+def prefer_domain_specific_image(url, doc):
+    # Picked by the host's plugin selector in parse_page (see data/domain_plugins.json)
+    src = doc.get("plugin_image")
+    return absolutize(url, src) if src else ""
+
+def static_image(url, doc):
+    for key in ("og:image", "twitter:image"):
+        if doc["meta"].get(key):
+            return absolutize(url, doc["meta"][key])
+    for src in doc["header_imgs"] or doc["imgs"]:
+        src = absolutize(url, src)
+        if looks_valid_img(src) and any(src.lower().endswith(e) for e in (".png", ".jpg", ".jpeg", ".webp")):
+            return src
     return ""
 
-async def pick_image_from_dom(page, url):
-    og = await page.query_selector('meta[property="og:image"]')
-    if og:
-        c = await og.get_attribute("content")
-        if c:
-            return absolutize(url, c)
-
-    tw = await page.query_selector('meta[name="twitter:image"]')
-    if tw:
-        c = await tw.get_attribute("content")
-        if c:
-            return absolutize(url, c)
-
-    header_imgs = await page.query_selector_all("header img, nav img")
-    checked_imgs = header_imgs or await page.query_selector_all("img")
-    for img in checked_imgs[:12]:
-        src = await img.get_attribute("src")
+# Collects every image candidate in one round-trip instead of one IPC call per element
+IMAGE_CANDIDATES_JS = """
+() => {
+  const attr = (sel, name) => { const el = document.querySelector(sel); return el ? el.getAttribute(name) : null; };
+  const headerImgs = Array.from(document.querySelectorAll("header img, nav img"));
+  const imgs = Array.from(document.querySelectorAll("img"));
+  return {
+    og: attr('meta[property="og:image"]', "content"),
+    twitter: attr('meta[name="twitter:image"]', "content"),
+    checked: (headerImgs.length ? headerImgs : imgs).slice(0, 12).map(i => i.getAttribute("src")),
+    styles: Array.from(document.querySelectorAll('[style*="background"]')).slice(0, 20).map(e => e.getAttribute("style") || ""),
+    sized: imgs.slice(0, 80).map(i => {
+      const r = i.getBoundingClientRect();
+      return [i.getAttribute("src"), r.width, r.height];
+    }),
+  };
+}
+"""
+
+def choose_dom_image(url, found):
+    for key in ("og", "twitter"):
+        if found.get(key):
+            return absolutize(url, found[key])
+
+    for src in found.get("checked") or []:
         if src:
             src = absolutize(url, src)
             if looks_valid_img(src) and any(src.lower().endswith(e) for e in (".png", ".jpg", ".jpeg", ".webp")):
                 return src
 
-    elems = await page.query_selector_all('[style*="background"]')
-    for el in elems[:20]:
-        style = await el.get_attribute("style") or ""
+    for style in found.get("styles") or []:
         m = re.search(r'background(?:-image)?\s*:\s*[^;]*url\(\s*(?:[\'"])?([^)\'"]+)', style, re.I)
         if m:
             src = absolutize(url, m.group(1))
             if looks_valid_img(src):
                 return src
 
-    imgs = await page.query_selector_all("img")
     max_area = 0
     best = None
-    for img in imgs[:80]:
-        src = await img.get_attribute("src")
+    for src, width, height in found.get("sized") or []:
         if not src or not looks_valid_img(src):
             continue
-        box = await img.bounding_box()
-        if not box:
-            continue
-        area = (box.get("width") or 0) * (box.get("height") or 0)
+        area = (width or 0) * (height or 0)
         if area > max_area and area >= 2500:
             max_area = area
             best = src
     if best:
         return absolutize(url, best)
+    return ""
+
+async def pick_image_from_dom(page, url):
+    try:
+        found = await page.evaluate(IMAGE_CANDIDATES_JS)
+    except Exception:
+        found = {}
+    src = choose_dom_image(url, found or {})
+    if src:
+        return src
 
     try:
         host = urlparse(url).netloc
@@ -149,44 +281,119 @@ async def pick_image_from_dom(page, url):
     domain = urlparse(url).netloc.replace("www.", "")
     return f"https://ui-avatars.com/api/?name={domain}&background=random"
 
-async def scrape_one(context, entry):
-    keep_image = bool(entry.get("image"))
+def extract_fields(entry, doc, final_url, refresh):
+    image = entry.get("image") if (entry.get("image") and not refresh) else None
+    if not image:
+        image = prefer_domain_specific_image(final_url, doc) or None
+
+    offer_snippet = entry.get("offer_snippet", "")
+    if not offer_snippet or refresh:
+        offer_snippet = extract_offer_snippet(doc)
+
+    offers = entry.get("offers", [])
+    if not offers or refresh:
+        offers = extract_offers_texts(doc)
+    return image, offer_snippet, offers
+
+def store_fields(entry, image, offer_snippet, offers, region=None):
+    entry["image"] = image or entry.get("image", "")
+    if region:
+        entry["offer_hash"] = region
+    if offer_snippet:
+        entry["offer_snippet"] = offer_snippet
+    if offers:
+        entry["offers"] = offers
+    entry["last_checked_ts"] = int(time.time())
+
+def scrape_static(entry, html, final_url, refresh):
+    # Only accept the static page when it yields everything the browser path would;
+    # returns the stats status, or None when the entry needs the browser
+    doc = parse_page(html, domain_plugins.lookup(final_url, follow_redirect=True))
+    region = offer_region_hash(doc)
+    if offers_unchanged(entry, region):
+        entry["last_checked_ts"] = int(time.time())
+        return "skip:offers_unchanged"
+    image, offer_snippet, offers = extract_fields(entry, doc, final_url, refresh)
+    if not image:
+        image = static_image(final_url, doc)
+    if not (image and offer_snippet and offers):
+        return None
+    store_fields(entry, image, offer_snippet, offers, region)
+    return "ok:static"
+
+def host_blocked(host):
+    labels = host.split(".")
+    return any(".".join(labels[i:]) in BLOCK_HOSTS for i in range(len(labels) - 1))
+
+async def block_route(route):
+    req = route.request
+    if req.resource_type in BLOCK_RESOURCES or host_blocked(hostname(req.url)):
+        await route.abort()
+    else:
+        await route.continue_()
+
+# True once og meta is present and the page has rendered enough list/paragraph text
+READY_JS = """
+(minText) => {
+  if (!document.querySelector('meta[property="og:title"], meta[property="og:image"]')) return false;
+  let n = 0;
+  for (const el of document.querySelectorAll("li, p")) {
+    if ((el.textContent || "").trim().length >= 15 && ++n >= minText) return true;
+  }
+  return false;
+}
+"""
+
+async def wait_for_content(page):
+    if WAIT_MODE == "fixed":
+        await page.wait_for_timeout(JS_WAIT_MS)
+        return
+    # Stop at whichever comes first: content ready, network idle, or the JS_WAIT_MS cap
+    pending = {
+        asyncio.ensure_future(page.wait_for_function(READY_JS, arg=WAIT_MIN_TEXT_NODES, timeout=JS_WAIT_MS)),
+        asyncio.ensure_future(page.wait_for_load_state("networkidle", timeout=JS_WAIT_MS)),
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(t.exception() is None for t in done):
+                break
+    finally:
+        for t in pending:
+            t.cancel()
+
+async def scrape_one(context, entry, refresh=False):
     url = best_link(entry.get("links", []))
     if not url:
         entry["last_checked_ts"] = int(time.time())
         return entry, "skip:no_url"
 
+    host = merchant_host(url)
     page = await context.new_page()
     page.set_default_navigation_timeout(NAV_TIMEOUT_MS)
     try:
-        await page.goto(url, wait_until="domcontentloaded")
-        await page.wait_for_timeout(JS_WAIT_MS)
+        with metrics.span("navigation", host=host):
+            await page.goto(url, wait_until="domcontentloaded")
+        # The remaining stages are timed against the page the redirects ended on
+        host = hostname(page.url) or host
+        with metrics.span("js_wait", host=host):
+            await wait_for_content(page)
         html = await page.content()
         final_url = page.url
 
-        soup = BeautifulSoup(html, "html.parser")
+        with metrics.span("parse", host=host):
+            doc = parse_page(html, domain_plugins.lookup(final_url, follow_redirect=True))
+        region = offer_region_hash(doc)
+        if offers_unchanged(entry, region):
+            entry["last_checked_ts"] = int(time.time())
+            return entry, "skip:offers_unchanged"
 
-        image = entry.get("image") if (keep_image and not FORCE_REFRESH) else None
-        if not image:
-            preferred = prefer_domain_specific_image(final_url, soup)
-            image = preferred or image
+        image, offer_snippet, offers = extract_fields(entry, doc, final_url, refresh)
         if not image:
-            image = await pick_image_from_dom(page, final_url)
+            with metrics.span("image_pick", host=host):
+                image = await pick_image_from_dom(page, final_url)
 
-        offer_snippet = entry.get("offer_snippet", "")
-        if not offer_snippet or FORCE_REFRESH:
-            offer_snippet = extract_offer_snippet(soup)
-
-        offers = entry.get("offers", [])
-        if not offers or FORCE_REFRESH:
-            offers = extract_offers_texts(soup)
-
-        entry["image"] = image or entry.get("image", "")
-        if offer_snippet:
-            entry["offer_snippet"] = offer_snippet
-        if offers:
-            entry["offers"] = offers
-        entry["last_checked_ts"] = int(time.time())
+        store_fields(entry, image, offer_snippet, offers, region)
         return entry, "ok"
     except Exception:
         entry["last_checked_ts"] = int(time.time())
@@ -194,28 +401,259 @@ async def scrape_one(context, entry):
     finally:
         await page.close()
 
+def is_fresh(entry, now):
+    checked = entry.get("last_checked_ts")
+    if not checked or not entry.get("offer_snippet"):
+        return False
+    if STALE_DAYS:
+        days = float(STALE_DAYS)
+    else:
+        days = float(STALE_DAYS_BY_TYPE.get(entry.get("product_type"), DEFAULT_STALE_DAYS))
+    return now - int(checked) < days * 86400
+
+_VOLATILE_RE = re.compile(r"<(script|style|noscript)\b.*?</\1>|<!--.*?-->", re.I | re.S)
+
+def content_hash(html):
+    cleaned = _VOLATILE_RE.sub("", html or "")
+    cleaned = re.sub(r"\s+", " ", cleaned).strip()
+    return hashlib.sha1(cleaned.encode("utf-8", "ignore")).hexdigest()
+
+def probe(session, url, cached):
+    # Conditional GET against the last seen validators; returns (cache_record, changed, response)
+    cached = cached or {}
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        r = session.get(url, headers=headers, allow_redirects=True, timeout=HTTP_TIMEOUT)
+    except Exception:
+        return cached, True, None
+    record = {
+        "etag": r.headers.get("ETag") or cached.get("etag", ""),
+        "last_modified": r.headers.get("Last-Modified") or cached.get("last_modified", ""),
+        "content_hash": cached.get("content_hash", ""),
+        "status": r.status_code,
+        "checked_ts": int(time.time()),
+    }
+    if r.status_code == 304:
+        return record, False, None
+    if r.status_code >= 400:
+        return record, True, None
+    record["content_hash"] = content_hash(r.text)
+    return record, record["content_hash"] != cached.get("content_hash"), r
+
+def merchant_host(url):
+    # Host of the bank page itself: affiliate redirectors wrap most catalog links, and keying
+    # per-host state by the redirector would lump every wrapped bank together
+    return hostname(domain_plugins.redirect_target(url) or url)
+
+async def run_pool(data, indices, fn):
+    slots = asyncio.Semaphore(CONCURRENCY)
+    host_slots = {}
+
+    async def worker(i):
+        entry = data[i]
+        host = merchant_host(best_link(entry.get("links", [])))
+        host_slot = host_slots.setdefault(host, asyncio.Semaphore(PER_HOST_CONCURRENCY))
+        # Take the per-host slot first so a busy bank doesn't hold global slots idle
+        async with host_slot, slots:
+            await fn(i, entry)
+
+    await asyncio.gather(*(worker(i) for i in indices))
+
+def bump(stats, status):
+    stats[status] = stats.get(status, 0) + 1
+    metrics.count("scrape_outcome", status=status)
+
+def needs_js(url, tiers, now):
+    host = merchant_host(url)
+    if FETCH_TIER == "js" or host in JS_HOSTS:
+        return True
+    plugin = domain_plugins.lookup(url, follow_redirect=True)
+    if plugin and plugin.get("tier") in ("static", "js"):
+        return plugin["tier"] == "js"
+    known = tiers.get(host) or {}
+    return known.get("tier") == "js" and now - int(known.get("ts", 0)) < TIER_TTL_DAYS * 86400
+
+def learn_tier(tiers, host, tier, now):
+    # Within one run, a host that needed the browser for any of its pages stays "js"
+    known = tiers.get(host) or {}
+    if known.get("ts") == now and known.get("tier") == "js":
+        return
+    tiers[host] = {"tier": tier, "ts": now}
+
+def http_session():
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = requests.adapters.HTTPAdapter(pool_connections=CONCURRENCY, pool_maxsize=CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def load_journal(path, now):
+    # id -> last journaled result of an unfinished run; old journals are ignored
+    done = {}
+    for rec in history_store.read(path):
+        if rec.get("id") and now - int(rec.get("ts") or 0) < RESUME_MAX_AGE_H * 3600:
+            done[rec["id"]] = rec
+    return done
+
+def resume(data, cache, journal):
+    # Puts journaled results back on their entries; returns the indices that are already done
+    done = set()
+    for i, entry in enumerate(data):
+        rec = journal.get(catalog.entry_id(entry))
+        if not rec:
+            continue
+        for k in catalog.ENRICHED_FIELDS:
+            if k in rec:
+                entry[k] = rec[k]
+        if rec.get("fetch"):
+            cache[rec["fetch"]["url"]] = rec["fetch"]["record"]
+        done.add(i)
+    return done
+
+def journal_record(entry, status, cache):
+    rec = dict(catalog.enrichment_record(entry), status=status, ts=int(time.time()))
+    url = best_link(entry.get("links", []))
+    if url and cache.get(url):
+        rec["fetch"] = {"url": url, "record": cache[url]}
+    return rec
+
+async def triage(data, indices, cache, tiers, stats, refresh, on_done=None):
+    # Decide which entries actually need a browser; everything else is settled here
+    now = int(time.time())
+    session = http_session()
+    todo = set()
+
+    async def check(i, entry):
+        url = best_link(entry.get("links", []))
+        if not url:
+            entry["last_checked_ts"] = now
+            bump(stats, "skip:no_url")
+            return
+        if INCREMENTAL and not FORCE_REFRESH and is_fresh(entry, now):
+            bump(stats, "skip:fresh")
+            return
+        host = merchant_host(url)
+        js_only = needs_js(url, tiers, now)
+        if not INCREMENTAL and js_only:
+            todo.add(i)
+            return
+
+        cached = cache.get(url) if INCREMENTAL and not FORCE_REFRESH else None
+        with metrics.span("static_fetch", host=host):
+            record, changed, resp = await asyncio.to_thread(probe, session, url, cached)
+        if record and INCREMENTAL:
+            cache[url] = record
+        if INCREMENTAL and not FORCE_REFRESH and not changed and entry.get("offer_snippet"):
+            entry["last_checked_ts"] = now
+            bump(stats, "skip:unchanged")
+            return
+
+        if not js_only and resp is not None:
+            with metrics.span("parse", host=hostname(resp.url) or host, tier="static"):
+                status = scrape_static(entry, resp.text, resp.url, refresh)
+            if status:
+                learn_tier(tiers, host, "static", now)
+                bump(stats, status)
+                return
+            learn_tier(tiers, host, "js", now)
+        todo.add(i)
+
+    async def settle(i, entry):
+        try:
+            await check(i, entry)
+        except Exception:
+            # One bad page or selector must not abort the run; the browser pass gets another go
+            # and counts the entry's final outcome, so this is tallied apart from "error"
+            bump(stats, "error:static")
+            todo.add(i)
+        if on_done and i not in todo:
+            on_done(i, "triaged")
+
+    try:
+        await run_pool(data, indices, settle)
+    finally:
+        session.close()
+    return sorted(todo)
+
 async def main_async():
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=["--no-sandbox"])
-        context = await browser.new_context()
-        results = []
-        stats = {}
-        for entry in data:
-            updated, status = await scrape_one(context, entry)
-            results.append(updated)
-            stats[status] = stats.get(status, 0) + 1
-        await browser.close()
-
-    os.makedirs(os.path.dirname(OUT_FILE), exist_ok=True)
-    with open(OUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    # Incremental runs start from the merged view so existing enrichment carries over
+    if INCREMENTAL and not FORCE_REFRESH:
+        data = catalog.load_catalog(use_snapshot=False)
+    else:
+        data = list(catalog.iter_entries(DATA_FILE))
+
+    domain_plugins.check_selectors()
+    results = list(data)
+    previous = [(e.get("offer_hash"), list(e.get("offers") or []), e.get("offer_snippet", "")) for e in data]
+    stats = {}
+    cache = {}
+    tiers = {}
+    # In incremental mode anything that gets fetched is stale or changed, so re-extract it
+    refresh = FORCE_REFRESH or INCREMENTAL
+    if INCREMENTAL and not FORCE_REFRESH:
+        cache = load_json(FETCH_CACHE_FILE, default={}) or {}
+
+    # Every finished entry is journaled at once, so a killed run loses at most what was in flight
+    resumed = resume(data, cache, load_journal(ENRICH_JOURNAL_FILE, time.time()))
+    if resumed:
+        stats["resumed"] = len(resumed)
+    todo = [i for i in range(len(data)) if i not in resumed]
+
+    def finish(i, status):
+        entry = results[i]
+        change = entry_change(previous[i], entry, int(time.time()))
+        if change:
+            history_store.append(OFFER_CHANGES_FILE, change)
+            bump(stats, "offers_changed")
+        if status != "error":
+            history_store.append(ENRICH_JOURNAL_FILE, journal_record(entry, status, cache))
+
+    if INCREMENTAL or FETCH_TIER != "js":
+        tiers = load_json(FETCH_TIERS_FILE, default={}) or {}
+        todo = await triage(data, todo, cache, tiers, stats, refresh, on_done=finish)
+
+    if todo:
+        # Playwright loads only when some entry actually needs the browser
+        from playwright.async_api import async_playwright
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True, args=["--no-sandbox"])
+            contexts = [await browser.new_context() for _ in range(CONTEXTS)]
+            if BLOCK_RESOURCES or BLOCK_HOSTS:
+                for context in contexts:
+                    await context.route("**/*", block_route)
+
+            async def scrape(i, entry):
+                try:
+                    updated, status = await scrape_one(contexts[i % len(contexts)], entry, refresh)
+                except Exception:
+                    entry["last_checked_ts"] = int(time.time())
+                    updated, status = entry, "error"
+                results[i] = updated
+                bump(stats, status)
+                finish(i, status)
+
+            await run_pool(data, todo, scrape)
+            await browser.close()
+
+    # Also applied to entries skipped this run, so older enrichment gets cleaned up too
+    stats.update(dedup.dedup_catalog(results))
+    catalog.save_enrichment(results, OUT_FILE)
+    if cache:
+        save_json(FETCH_CACHE_FILE, cache)
+    if tiers:
+        save_json(FETCH_TIERS_FILE, tiers, sort_keys=True)
+    # Everything is in the enriched file now; the next run starts fresh
+    if os.path.exists(ENRICH_JOURNAL_FILE):
+        os.remove(ENRICH_JOURNAL_FILE)
     print("STATS:", stats)
 
 def main():
     asyncio.run(main_async())
 
 if __name__ == "__main__":
-    main()
+    metrics.run(main, "scraper")
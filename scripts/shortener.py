@@ -0,0 +1,74 @@
+import os
+import time
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from config import HTTP_TIMEOUT
+
+SHORTENER = os.getenv("SHORTENER", "tinyurl").lower()
+
+def url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:20]
+
+def tinyurl(session, url):
+    r = session.get("https://tinyurl.com/api-create.php", params={"url": url}, timeout=HTTP_TIMEOUT)
+    if r.status_code == 200 and r.text.startswith("http"):
+        return r.text.strip()
+    return ""
+
+def identity(session, url):
+    return url
+
+# name -> fn(session, long_url) returning the short URL, or "" on failure
+BACKENDS = {
+    "tinyurl": tinyurl,
+    "none": identity,
+}
+
+def register_backend(name, fn):
+    BACKENDS[name] = fn
+
+def cached_short(cache, url):
+    rec = (cache or {}).get(url_key(url))
+    if rec and rec.get("url") == url and rec.get("short"):
+        return rec["short"]
+    return ""
+
+def shorten(url, cache, session=None, backend=None):
+    # Returns the short URL (cached or freshly created), falling back to the long URL
+    if not url:
+        return url
+    hit = cached_short(cache, url)
+    if hit:
+        metrics.count("shorten", result="cache_hit")
+        return hit
+    name = backend or SHORTENER
+    fn = BACKENDS.get(name, identity)
+    own = session is None
+    session = session or requests.Session()
+    try:
+        with metrics.span("shorten", backend=name):
+            short = fn(session, url)
+    except Exception:
+        short = ""
+    finally:
+        if own:
+            session.close()
+    metrics.count("shorten", result="created" if short else "failed")
+    if not short:
+        return url
+    if short != url:
+        cache[url_key(url)] = {"url": url, "short": short, "backend": name, "ts": int(time.time())}
+    return short
+
+def shorten_many(urls, cache, workers=4, backend=None):
+    todo = sorted({u for u in urls if u and not cached_short(cache, u)})
+    if todo:
+        session = requests.Session()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda u: shorten(u, cache, session, backend), todo))
+        finally:
+            session.close()
+    return {u: cached_short(cache, u) or u for u in urls if u}
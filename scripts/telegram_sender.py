@@ -0,0 +1,119 @@
+import os
+import time
+import json
+import random
+import threading
+import requests
+import metrics
+from config import HTTP_TIMEOUT
+
+# Point at a local fake (scripts/fake_bot_api.py) to exercise the pipeline without Telegram
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+# Telegram allows ~20 messages/minute into one group or channel and ~1/s per chat
+CHAT_RATE_PER_MIN = float(os.getenv("CHAT_RATE_PER_MIN", "20"))
+CHAT_BURST = max(1, int(os.getenv("CHAT_BURST", "1")))
+BACKOFF_BASE_S = float(os.getenv("BACKOFF_BASE_S", "1"))
+BACKOFF_MAX_S = float(os.getenv("BACKOFF_MAX_S", "60"))
+
+class TelegramError(Exception):
+    def __init__(self, method, status, description, retry_after=None):
+        super().__init__(f"{method}: HTTP {status}: {description}")
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status == 429 or self.status >= 500 or self.status == 0
+
+class TokenBucket:
+    def __init__(self, rate_per_s, capacity):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        # After a 429 nothing else should go out to this chat until retry_after has passed
+        with self.lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class Sender:
+    def __init__(self, token, chat_id, api_base=None, session=None):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_base = (api_base or TELEGRAM_API_BASE).rstrip("/")
+        self.session = session or requests.Session()
+        self.bucket = TokenBucket(CHAT_RATE_PER_MIN / 60.0, CHAT_BURST)
+
+    def call(self, method, data=None, json=None, files=None):
+        url = f"{self.api_base}/bot{self.token}/{method}"
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            with metrics.span("rate_limit_wait", method=method):
+                self.bucket.acquire()
+            try:
+                with metrics.span("telegram_send", method=method):
+                    r = self.session.post(url, data=data, json=json, files=files, timeout=HTTP_TIMEOUT)
+                try:
+                    body = r.json()
+                except ValueError:
+                    body = {}
+                if r.status_code < 400 and body.get("ok", True):
+                    metrics.count("telegram_response", method=method, status=r.status_code)
+                    return body.get("result")
+                params = body.get("parameters") or {}
+                err = TelegramError(method, r.status_code, body.get("description") or r.text[:200], params.get("retry_after"))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                err = TelegramError(method, 0, type(e).__name__)
+            metrics.count("telegram_response", method=method, status=err.status)
+            if not err.retryable or attempt == SEND_MAX_RETRIES:
+                raise err
+            metrics.count("telegram_retry", method=method)
+            if err.retry_after:
+                self.bucket.penalize(float(err.retry_after))  # the next acquire() waits it out
+                continue
+            time.sleep(min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt)) * (0.5 + random.random() / 2))
+
+    def send_message(self, text, parse_mode="HTML", disable_preview=False):
+        payload = {"chat_id": self.chat_id, "text": text, "disable_web_page_preview": disable_preview}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return self.call("sendMessage", json=payload)
+
+    def send_photo(self, photo, caption, parse_mode=None):
+        # photo: URL, file_id, or raw image bytes to upload
+        data = {"chat_id": self.chat_id, "caption": caption}
+        files = None
+        if isinstance(photo, bytes):
+            files = {"photo": ("photo.jpg", photo)}
+        else:
+            data["photo"] = photo
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        return self.call("sendPhoto", data=data, files=files)
+
+    def send_media_group(self, media, files=None):
+        # media: [{"type": "photo", "media": url_or_file_id_or_attach, "caption": ...}], 2..10 items;
+        # files maps attach://<name> names to uploaded bytes
+        if files:
+            data = {"chat_id": self.chat_id, "media": json.dumps(media, ensure_ascii=False)}
+            return self.call("sendMediaGroup", data=data, files={k: (k, v) for k, v in files.items()})
+        return self.call("sendMediaGroup", json={"chat_id": self.chat_id, "media": media})
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,10 @@
+import datetime
+
+# Post times, queue days and weekday rules are all Indian Standard Time (UTC+5:30, no DST)
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+def ist_now():
+    return datetime.datetime.now(IST)
+
+def ist_today():
+    return ist_now().date()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts import each other as top-level modules, the way the workflows run them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
@@ -0,0 +1,37 @@
+import dedup
+
+MENU = "Smartbuy Compare & Fly Compare & Shop Deals & Offers SmartBuy Hotels Dining Offers"
+
+def test_menu_variants_collapse_to_plain_form():
+    lines = [
+        "OFFERS Offers, Discounts " + MENU + " OFFERS FOR YOU",
+        MENU,
+        MENU + " OFFERS FOR YOU",
+        "This offer is not applicable to physical Credit Card applications.",
+    ]
+    assert dedup.dedup_lines(lines) == [MENU, lines[3]]
+
+def test_distinct_short_offers_are_kept():
+    pairs = [
+        ["Get 5% cashback on fuel", "Get 5% cashback on dining"],
+        ["Complimentary domestic lounge access", "Complimentary international lounge access"],
+        ["4 complimentary domestic lounge visits per quarter", "4 complimentary international lounge visits per quarter"],
+        ["10X reward points on dining", "5X reward points on dining"],
+    ]
+    for pair in pairs:
+        assert dedup.dedup_lines(pair) == pair
+
+def test_exact_repeats_of_short_lines_are_dropped():
+    assert dedup.dedup_lines(["Cashback rewards", "cashback  rewards", "Lounge access"]) == ["Cashback rewards", "Lounge access"]
+
+def test_entries_with_same_merchant_link_are_marked():
+    snippet = "Yes Bank Credit Card Affiliate Program with Payout 1197 per lead. Join our Yes Bank Credit Card Affiliate Program for affiliate earnings."
+    link = [{"type": "official", "url": "https://linksredirect.com/?cid=1&url=https%3A%2F%2Fwww.cuelinks.com%2Fcampaigns%2Fyes-bank"}]
+    entries = [
+        {"name": "YES Bank Credit Cards", "links": link, "offer_snippet": snippet},
+        {"name": "YES Bank (Campaign Listing)", "links": [{"url": "https://cuelinks.com/campaigns/yes-bank/"}], "offer_snippet": snippet},
+        {"name": "Other bank", "links": [{"url": "https://example.com/other"}], "offer_snippet": snippet},
+    ]
+    dedup.mark_duplicates(entries)
+    assert entries[1]["duplicate_of"] == dedup.entry_id(entries[0])
+    assert "duplicate_of" not in entries[0] and "duplicate_of" not in entries[2]
@@ -0,0 +1,43 @@
+import shortener
+
+def register(monkeypatch, name, fn):
+    # Registered through the public hook; monkeypatch drops it again after the test
+    monkeypatch.setattr(shortener, "BACKENDS", dict(shortener.BACKENDS))
+    shortener.register_backend(name, fn)
+
+def counting_backend(calls):
+    def backend(session, url):
+        calls.append(url)
+        return "https://sho.rt/" + shortener.url_key(url)[:6]
+    return backend
+
+def test_miss_creates_entry_and_hit_skips_backend(monkeypatch):
+    calls = []
+    register(monkeypatch, "test-counting", counting_backend(calls))
+    cache = {}
+    url = "https://example.com/apply?card=gold"
+    short = shortener.shorten(url, cache, backend="test-counting")
+    assert calls == [url]
+    assert cache[shortener.url_key(url)]["short"] == short
+    assert cache[shortener.url_key(url)]["backend"] == "test-counting"
+
+    assert shortener.shorten(url, cache, backend="test-counting") == short
+    assert calls == [url]
+
+def test_batch_only_shortens_uncached_urls(monkeypatch):
+    calls = []
+    register(monkeypatch, "test-counting", counting_backend(calls))
+    cache = {}
+    cached = "https://example.com/a"
+    shortener.shorten(cached, cache, backend="test-counting")
+    calls.clear()
+    urls = [cached, "https://example.com/b", "https://example.com/b", ""]
+    shorts = shortener.shorten_many(urls, cache, backend="test-counting")
+    assert calls == ["https://example.com/b"]
+    assert set(shorts) == {cached, "https://example.com/b"}
+
+def test_failed_backend_falls_back_to_long_url(monkeypatch):
+    register(monkeypatch, "test-failing", lambda session, url: "")
+    cache = {}
+    assert shortener.shorten("https://example.com/x", cache, backend="test-failing") == "https://example.com/x"
+    assert cache == {}
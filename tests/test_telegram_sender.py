@@ -0,0 +1,83 @@
+import json
+import pytest
+import fake_bot_api
+import telegram_sender
+import post_to_telegram
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(fake_bot_api.FakeBotApi, "calls", [])
+    monkeypatch.setattr(telegram_sender, "CHAT_RATE_PER_MIN", 60000)
+    monkeypatch.setattr(telegram_sender, "BACKOFF_BASE_S", 0.01)
+    server = fake_bot_api.serve(0)
+    sender = telegram_sender.Sender("TOKEN", "@chan", api_base=f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(post_to_telegram, "_sender", sender)
+    yield sender
+    sender.close()
+    server.shutdown()
+
+def methods():
+    return [c["method"] for c in fake_bot_api.FakeBotApi.calls]
+
+def test_5xx_is_retried_until_it_goes_through(api, monkeypatch):
+    monkeypatch.setattr(fake_bot_api, "FAKE_500_EVERY", 2)
+    api.send_message("one")
+    assert api.send_message("two")["message_id"] == 3
+    assert methods() == ["sendMessage"] * 3
+
+def test_429_is_retried_after_retry_after(api, monkeypatch):
+    monkeypatch.setattr(fake_bot_api, "FAKE_429_EVERY", 1)
+    monkeypatch.setattr(telegram_sender, "SEND_MAX_RETRIES", 1)
+    with pytest.raises(telegram_sender.TelegramError) as e:
+        api.send_message("hi")
+    assert e.value.status == 429 and e.value.retryable
+    assert len(methods()) == 2
+
+def test_photo_falls_back_to_text_only_for_permanent_errors(api, monkeypatch):
+    assert post_to_telegram.post_photo("https://example.com/bad-image.jpg", "caption") == "text_fallback"
+    assert methods() == ["sendPhoto", "sendMessage"]
+
+    fake_bot_api.FakeBotApi.calls.clear()
+    monkeypatch.setattr(fake_bot_api, "FAKE_500_EVERY", 1)
+    monkeypatch.setattr(telegram_sender, "SEND_MAX_RETRIES", 1)
+    with pytest.raises(telegram_sender.TelegramError):
+        post_to_telegram.post_photo("https://example.com/card.jpg", "caption")
+    assert methods() == ["sendPhoto", "sendPhoto"]
+
+def test_failed_send_goes_back_on_the_queue(api, monkeypatch, tmp_path):
+    queue_file = str(tmp_path / "queue.json")
+    history_file = str(tmp_path / "history.jsonl")
+    monkeypatch.setattr(post_to_telegram, "QUEUE_FILE", queue_file)
+    monkeypatch.setattr(post_to_telegram, "POST_HISTORY_FILE", history_file)
+    monkeypatch.setattr(fake_bot_api, "FAKE_500_EVERY", 1)
+    monkeypatch.setattr(telegram_sender, "SEND_MAX_RETRIES", 2)
+    render = {"valid_until": 2 ** 40, "url": "https://example.com/apply", "short_url": "https://example.com/apply",
+              "image": "", "caption": "Card", "html": "<b>Card</b>"}
+    queue = [{"id": "a", "name": "Card A", "render": render}, {"id": "b", "name": "Card B", "render": render}]
+    with open(queue_file, "w", encoding="utf-8") as f:
+        json.dump(queue, f)
+
+    assert post_to_telegram.post_next(fallback_random=False) == "requeued"
+    with open(queue_file, encoding="utf-8") as f:
+        assert [item["id"] for item in json.load(f)] == ["a", "b"]
+    assert not (tmp_path / "history.jsonl").exists()
+    assert methods() == ["sendMessage"] * 3
+
+    monkeypatch.setattr(fake_bot_api, "FAKE_500_EVERY", 0)
+    assert post_to_telegram.post_next(fallback_random=False) == "posted"
+    with open(queue_file, encoding="utf-8") as f:
+        assert [item["id"] for item in json.load(f)] == ["b"]
+
+def test_daemon_rebuilds_a_queue_left_from_another_day(monkeypatch, tmp_path):
+    queue_file = str(tmp_path / "queue.json")
+    monkeypatch.setattr(post_to_telegram, "QUEUE_FILE", queue_file)
+    monkeypatch.setattr(post_to_telegram, "DAEMON_STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(post_to_telegram.catalog, "load_catalog", lambda: [])
+    builds = []
+    monkeypatch.setattr(post_to_telegram.build_schedule, "build_day_queue", lambda *a: builds.append(a) or [])
+    for plan_date, rebuilt in (("2026-10-16", True), ("2026-10-17", False)):
+        with open(queue_file, "w", encoding="utf-8") as f:
+            json.dump([{"id": "a", "plan_date": plan_date}], f)
+        builds.clear()
+        post_to_telegram.ensure_day_queue({}, {}, "2026-10-17")
+        assert bool(builds) == rebuilt